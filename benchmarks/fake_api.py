@@ -0,0 +1,130 @@
+"""
+Stand-in for T_API replaying recorded tweets, no network and no API quota involved.
+"""
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from twisper.records import TweetRecord, loads
+
+
+TWITTER_DATE = '%a %b %d %H:%M:%S %z %Y'
+
+
+def read_corpus(path: str) -> Iterator[dict]:
+    """
+    Tweets from a JSONL file, one v1.1 tweet json per line
+    """
+    with open(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield loads(line)
+
+
+def synthetic_corpus(size: int, config: Any, seed: int = 42) -> Iterator[dict]:
+    """
+    Deterministic tweets mixing the configured tags, banned keywords, retweets and old tweets
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    filler = ['the', 'win', 'a', 'brand', 'new', 'phone', 'today', 'winner', 'picked',
+              'friday', 'good', 'luck', 'everyone', 'share', 'with', 'friends']
+    tags = [config.TAGS_RT, config.TAGS_FOLLOW, config.TAGS_MSG, config.TAGS_LIKE,
+            config.BANNED_KEYWORDS, config.TAGS_SEARCH]
+
+    def user(i: int) -> dict:
+        name = f'user{i}'
+        if rng.random() < 0.02:
+            name += rng.choice(config.BANNED_NAME_KEYWORDS or ['x'])
+        return {'id': i, 'screen_name': f'user{i}', 'name': name,
+                'followers_count': rng.randint(0, 100000)}
+
+    def tweet(i: int) -> dict:
+        words = rng.choices(filler, k=rng.randint(8, 30))
+        for keywords in tags:
+            if keywords and rng.random() < 0.4:
+                words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        created = now - timedelta(days=rng.random() * 2 * config.MAX_AGE)
+        return {
+            'id': i,
+            'text': ' '.join(words),
+            'created_at': created.strftime(TWITTER_DATE),
+            'retweet_count': int(rng.expovariate(1 / (2 * config.MIN_RT_COUNT + 1))),
+            # Repeat authors are common among giveaway accounts
+            'user': user(rng.randint(1, max(size // 20, 1))),
+            'entities': {'user_mentions': [user(rng.randint(1, size))
+                                           for _ in range(rng.randint(0, 3))]},
+        }
+
+    for i in range(1, size + 1):
+        data = tweet(i)
+        if rng.random() < 0.1:
+            data['retweeted_status'] = tweet(size + i)
+        yield data
+
+
+class FakeAPI:
+    """
+    Implements the T_API methods TwisperBot calls, counting every call
+    """
+
+    def __init__(self, tweets: Optional[Iterable[TweetRecord]] = None) -> None:
+        self.tweets: List[TweetRecord] = list(tweets or [])
+        self.statuses: Dict[int, TweetRecord] = {x.id: x for x in self.tweets}
+        self.calls: Counter = Counter()
+
+    def search_tweets(self, query, results, language, since_id=None, max_id=None,
+                      max_pages=1) -> tuple:
+        self.calls['search_tweets'] += 1
+        return [x for x in self.tweets if (since_id is None or x.id > since_id) and
+                (max_id is None or x.id <= max_id)], None
+
+    def close(self) -> None:
+        pass
+
+    def has_quota(self, endpoint) -> bool:
+        return True
+
+    def parse_status(self, data) -> TweetRecord:
+        return TweetRecord.from_json(data)
+
+    def cache_tweets(self, tweets) -> None:
+        for tweet in tweets:
+            self.statuses[tweet.id] = tweet
+
+    def get_statuses(self, tweet_ids, refresh=False) -> dict:
+        return {x: self.statuses[x] for x in tweet_ids if x in self.statuses}
+
+    def get_friends(self) -> list:
+        return []
+
+    def get_friend_ids(self) -> list:
+        return []
+
+    def lookup_users(self, user_ids) -> list:
+        return []
+
+    def lookup_friendships(self, screen_names) -> dict:
+        self.calls['lookup_friendships'] += 1
+        return {}
+
+    def retweet(self, id, dry_run) -> bool:
+        self.calls['retweet'] += 1
+        return True
+
+    def like(self, id, dry_run) -> bool:
+        self.calls['like'] += 1
+        return True
+
+    def send_message(self, author_id, username, msg_text, dry_run) -> bool:
+        self.calls['send_message'] += 1
+        return True
+
+    def follow(self, username, dry_run) -> bool:
+        self.calls['follow'] += 1
+        return True
+
+    def unfollow(self, screen_name, dry_run) -> bool:
+        self.calls['unfollow'] += 1
+        return True
@@ -0,0 +1,254 @@
+"""
+Offline replay benchmark of the TwisperBot filter and engage path.
+
+Replays a recorded (JSONL, one v1.1 tweet json per line) or synthetic corpus
+through validate_tweet, original_tweet, is_banned_user and engage against a
+fake T_API, then reports throughput, per stage latency percentiles, batch
+validation time and allocations.
+
+> python -m benchmarks.replay --sizes 1000 10000 100000 1000000
+> python -m benchmarks.replay --corpus recorded.jsonl --allocations
+> python -m benchmarks.replay --sizes 10000 --decode
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_api import FakeAPI, read_corpus, synthetic_corpus  # noqa: E402
+from twisper.config import Config  # noqa: E402
+from twisper.enums import TimerType  # noqa: E402
+from twisper.records import TweetRecord, records_from_json  # noqa: E402
+from twisper.scheduler import Scheduler, TokenBucket  # noqa: E402
+from twisper.twisper import TwisperBot  # noqa: E402
+
+
+STAGES = ('validate_tweet', 'original_tweet', 'is_banned_user', 'engage')
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def load_config(workdir: str) -> Config:
+    """
+    Default config with empty credentials, written to workdir so Config can read it
+    """
+    data: Dict[str, Any] = {}
+    for name in ('default_config.json', 'credentials_empty.json'):
+        with open(os.path.join(ROOT, 'config', name), 'r') as file:
+            data.update(json.load(file))
+
+    data['bot_config']['dry_run'] = True
+    data['search_config']['search_workers'] = 1
+
+    path = os.path.join(workdir, 'config.json')
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+    return Config(path)
+
+
+def percentile(values: List[int], pct: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def replay(bot: TwisperBot, tweets: List[TweetRecord]) -> Dict[str, array]:
+    """
+    Run every tweet through the same steps as the main loop, timing each stage
+    :return: latencies in ns per stage
+    """
+    timings = {x: array('q') for x in STAGES}
+    clock = time.perf_counter_ns
+
+    for tweet in tweets:
+        start = clock()
+        valid = bot.validate_tweet(tweet)
+        timings['validate_tweet'].append(clock() - start)
+        if not valid:
+            continue
+
+        start = clock()
+        tweet = bot.original_tweet(tweet)
+        timings['original_tweet'].append(clock() - start)
+        if tweet is None:
+            continue
+
+        start = clock()
+        banned = bot.is_banned_user(tweet)
+        timings['is_banned_user'].append(clock() - start)
+        if banned:
+            continue
+
+        start = clock()
+        bot.engage(tweet)
+        timings['engage'].append(clock() - start)
+
+    return timings
+
+
+def run(size: int, corpus: Optional[str], allocations: bool) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='twisper-replay-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs('data', exist_ok=True)
+    try:
+        config = load_config(workdir)
+
+        source = read_corpus(corpus) if corpus else synthetic_corpus(size, config)
+        start = time.perf_counter()
+        tweets = [TweetRecord.from_json(x) for x in islice(source, size)]
+        decode_secs = time.perf_counter() - start
+
+        api = FakeAPI(tweets)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            bot = TwisperBot(config, api=api)
+            # Actions are not what we measure here, never hold them back
+            bot._schedule = Scheduler({x: TokenBucket(1e12, 1, 1e12)
+                                       for x in TimerType if x != TimerType.EPOCH})
+
+            # Batch validation of the whole corpus, compare with validate_tweet in the stages
+            start = time.perf_counter()
+            valid = bot.validate_tweets(tweets)
+            batch_secs = time.perf_counter() - start
+            bot.matcher.match.cache_clear()
+
+            if allocations:
+                tracemalloc.start()
+            start = time.perf_counter()
+            timings = replay(bot, tweets)
+            elapsed = time.perf_counter() - start
+            if allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                blocks = sum(x.count for x in tracemalloc.take_snapshot().statistics('filename'))
+                tracemalloc.stop()
+
+            bot._schedule.drain(timeout=60)
+            bot.cleanup()
+
+        result: Dict[str, Any] = {
+            'tweets': len(tweets),
+            'decode_secs': decode_secs,
+            'elapsed_secs': elapsed,
+            'tweets_per_sec': len(tweets) / elapsed if elapsed else 0,
+            'batch_validate_secs': batch_secs,
+            'batch_valid': len(valid),
+            'api_calls': dict(api.calls),
+            'stages': {},
+        }
+        for stage, values in timings.items():
+            ordered = sorted(values)
+            result['stages'][stage] = {
+                'count': len(ordered),
+                **{f'p{x}_us': percentile(ordered, x) / 1000 for x in PERCENTILES},
+            }
+        if allocations:
+            result['allocations'] = {'current_bytes': current, 'peak_bytes': peak,
+                                     'live_blocks': blocks}
+
+        return result
+    finally:
+        os.chdir(cwd)
+
+
+def measure_decode(payload: str, decode: Any) -> Dict[str, float]:
+    """
+    Time and retained memory of decode(payload)
+    """
+    start = time.perf_counter()
+    decode(payload)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tweets = decode(payload)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tweets
+
+    return {'secs': elapsed, 'retained_bytes': current}
+
+
+def compare_decode(size: int, corpus: Optional[str]) -> None:
+    """
+    Decode a search response of size tweets into tweepy Status models and into TweetRecords
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        config = load_config(workdir)
+    source = read_corpus(corpus) if corpus else synthetic_corpus(size, config)
+    payload = json.dumps({'statuses': list(islice(source, size)), 'search_metadata': {}})
+
+    results = {'records': measure_decode(payload, records_from_json)}
+    try:
+        import tweepy
+        from tweepy.parsers import ModelParser
+
+        api = tweepy.API()
+        results['tweepy'] = measure_decode(payload, lambda x: ModelParser().parse(
+            x, api=api, payload_type='search_results'))
+    except ImportError:
+        pass
+
+    print(f'Decoding a {len(payload) / 1024 / 1024:.1f} MiB search response of {size} tweets:')
+    for name, stats in results.items():
+        print(f"  {name:<10}{stats['secs'] * 1000:10.1f} ms"
+              f"{stats['retained_bytes'] / 1024 / 1024:10.1f} MiB retained")
+    print()
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    print(f"{result['tweets']} tweets in {result['elapsed_secs']:.2f} s "
+          f"-> {result['tweets_per_sec']:.0f} tweets/s (decode {result['decode_secs']:.2f} s)")
+    header = 'stage'.ljust(16) + 'count'.rjust(10) + ''.join(
+        f'p{x}'.rjust(10) for x in PERCENTILES)
+    print(header + '  (us)')
+    for stage, stats in result['stages'].items():
+        print(stage.ljust(16) + str(stats['count']).rjust(10) + ''.join(
+            f"{stats[f'p{x}_us']:10.1f}" for x in PERCENTILES))
+    print(f"validate_tweets (batch): {result['batch_valid']} valid in "
+          f"{result['batch_validate_secs'] * 1000:.1f} ms "
+          f"({result['batch_validate_secs'] * 1e6 / max(result['tweets'], 1):.2f} us/tweet)")
+    if 'allocations' in result:
+        alloc = result['allocations']
+        print(f"allocations: peak {alloc['peak_bytes'] / 1024 / 1024:.1f} MiB, "
+              f"live {alloc['live_blocks']} blocks")
+    print(f"api calls: {result['api_calls']}")
+    print()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Corpus sizes to replay')
+    parser.add_argument('--corpus', help='JSONL corpus, synthetic tweets are used if omitted')
+    parser.add_argument('--allocations', action='store_true',
+                        help='Trace allocations (slows the replay down)')
+    parser.add_argument('--decode', action='store_true',
+                        help='Compare decoding into tweepy models and into TweetRecords')
+    parser.add_argument('--output', help='Write the results as json to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        if args.decode:
+            compare_decode(size, args.corpus)
+        result = run(size, args.corpus, args.allocations)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
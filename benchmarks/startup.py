@@ -0,0 +1,76 @@
+"""
+Startup benchmark: import time of the entry modules, measured in fresh
+interpreters with -X importtime, and the slowest imports behind them.
+
+> python -m benchmarks.startup
+> python -m benchmarks.startup --modules twisper.worker --runs 10 --top 20
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('twisper', 'twisper.config', 'twisper.twisper', 'twisper.worker',
+           'twisper.supervisor', 'twisper.main')
+
+# import time:  self [us] | cumulative | imported package
+IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """
+    Import module in a fresh interpreter
+    :return: wall time (s), {imported module: (self us, cumulative us)}
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return wall, times
+
+
+def run(modules: List[str], runs: int, top: int) -> None:
+    baseline = min(import_times('sys')[0] for _ in range(runs))
+    print(f'Interpreter startup: {baseline * 1000:.1f} ms (best of {runs})\n')
+    print(f'{"module":<22}{"wall ms":>10}{"import ms":>12}{"modules":>10}')
+
+    slowest: Dict[str, int] = {}
+    for module in modules:
+        samples = [import_times(module) for _ in range(runs)]
+        walls = [x[0] for x in samples]
+        times = samples[-1][1]
+        cumulative = statistics.median(x[1].get(module, (0, 0))[1] for x in samples)
+        print(f'{module:<22}{min(walls) * 1000:>10.1f}{cumulative / 1000:>12.1f}{len(times):>10}')
+        for name, (self_us, _) in times.items():
+            slowest[name] = max(slowest.get(name, 0), self_us)
+
+    print('\nSlowest imports (self time):')
+    for name, self_us in sorted(slowest.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f'  {name:<40}{self_us / 1000:>8.1f} ms')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args(argv)
+
+    run(args.modules, args.runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
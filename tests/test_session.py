@@ -0,0 +1,106 @@
+"""
+create_session against a local HTTP server: connection reuse and retries per method
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from twisper.session import create_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self) -> None:
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        server.requests.append((self.command, self.client_address[1]))  # type: ignore[attr-defined]
+        status = server.statuses.pop(0) if server.statuses else 200  # type: ignore[attr-defined]
+
+        body = b'{}'
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_DELETE = _reply
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[ThreadingHTTPServer]:
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.requests: List[Tuple[str, int]] = []  # type: ignore[attr-defined, misc]
+    httpd.statuses: List[int] = []  # type: ignore[attr-defined, misc]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server: ThreadingHTTPServer, path: str = '/1.1/statuses/lookup.json') -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def test_close_keeps_connections(server):
+    session = create_session(backoff_factor=0)
+    # tweepy.API closes its session after every request
+    for _ in range(3):
+        assert session.get(url(server)).status_code == 200
+        session.close()
+
+    ports = {port for _, port in server.requests}
+    assert len(server.requests) == 3
+    assert len(ports) == 1
+    session.shutdown()
+
+
+def test_get_retried_on_server_error(server):
+    server.statuses.extend([503, 502])
+    session = create_session(retries=3, backoff_factor=0)
+
+    assert session.get(url(server)).status_code == 200
+    assert len(server.requests) == 3
+    session.shutdown()
+
+
+def test_post_not_retried_on_server_error(server):
+    server.statuses.append(503)
+    session = create_session(retries=3, backoff_factor=0)
+
+    response = session.post(url(server, '/1.1/direct_messages/events/new.json'), data='{}')
+    assert response.status_code == 503
+    assert server.requests == [('POST', server.requests[0][1])]
+    session.shutdown()
+
+
+def test_post_retried_on_rate_limit(server):
+    server.statuses.append(429)
+    session = create_session(retries=3, backoff_factor=0)
+
+    response = session.post(url(server, '/1.1/statuses/retweet/1.json'))
+    assert response.status_code == 200
+    assert [method for method, _ in server.requests] == ['POST', 'POST']
+    session.shutdown()
+
+
+def test_retry_policy_per_method():
+    session = create_session(retries=2, backoff_factor=0)
+    retry = session.get_adapter('http://').max_retries
+
+    # Connect errors count against total for any method, nothing was sent
+    assert retry.connect is None and retry.total == 2
+    assert not retry.is_retry('POST', 503)
+    assert retry.is_retry('POST', 429)
+    assert retry.is_retry('GET', 503)
+    session.shutdown()
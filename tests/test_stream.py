@@ -0,0 +1,102 @@
+"""
+TweetStream against a local server standing in for the filtered stream
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Iterator, List
+
+import pytest
+
+from twisper.records import TweetRecord
+from twisper.stream import TweetStream
+
+
+FULL_TEXT = ('Giveaway! RT and follow @sponsor to win a brand new phone, winner picked on friday. '
+             'Good luck everyone, share with your friends and tag @friend for a second entry')
+
+TWEET = {
+    'id': 1,
+    'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+    'text': FULL_TEXT[:137] + '...',
+    'truncated': True,
+    'user': {'id': 10, 'screen_name': 'author', 'name': 'Author'},
+    'entities': {'user_mentions': [{'id': 11, 'screen_name': 'sponsor'}]},
+    'extended_tweet': {
+        'full_text': FULL_TEXT,
+        'entities': {'user_mentions': [{'id': 11, 'screen_name': 'sponsor'},
+                                       {'id': 12, 'screen_name': 'friend'}]},
+    },
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        # Keep-alive newline, a limit notice, then one tweet
+        for line in (b'', json.dumps({'limit': {'track': 3}}).encode(),
+                     json.dumps(TWEET).encode()):
+            chunk = line + b'\r\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+        self.close_connection = True
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[ThreadingHTTPServer]:
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_stream_delivers_extended_tweets(server):
+    config = SimpleNamespace(API_KEY='key', API_KEY_SECRET='secret', ACCESS_TOKEN='token',
+                             ACCESS_TOKEN_SECRET='token_secret', TAGS_SEARCH=['giveaway'],
+                             STREAM_URL=f'http://127.0.0.1:{server.server_address[1]}/stream')
+    received: List[dict] = []
+    threads: List[str] = []
+    done = threading.Event()
+
+    def on_tweet(data: dict) -> None:
+        received.append(data)
+        threads.append(threading.current_thread().name)
+        done.set()
+
+    stream = TweetStream(config, on_tweet)  # type: ignore[arg-type]
+    stream.start()
+    try:
+        assert done.wait(5)
+    finally:
+        stream.stop()
+
+    # Only the tweet, keep-alives and notices are skipped
+    assert received[0]['id'] == 1
+    # Handled off the thread reading the connection
+    assert threads[0] == 'twisper-stream-handler'
+    tweet = TweetRecord.from_json(received[0])
+    assert tweet.text == FULL_TEXT
+    assert tweet.mentions == ('sponsor', 'friend')
+    assert tweet.mention_ids == (11, 12)
+
+
+def test_record_without_extended_tweet():
+    data = dict(TWEET, text='RT to win', truncated=False)
+    del data['extended_tweet']
+
+    tweet = TweetRecord.from_json(data)
+    assert tweet.text == 'RT to win'
+    assert tweet.mentions == ('sponsor',)
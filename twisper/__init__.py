@@ -1,14 +1,36 @@
 """ Twisper bot """
+import os
+
 __version__ = '2022.12.dev'
 
-if 'dev' in __version__:
+
+def _git_revision() -> str:
+    """
+    Short hash of the checked out commit, read from .git without spawning git
+    """
+    git_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.git')
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as file:
+        head = file.read().strip()
+    if not head.startswith('ref: '):
+        return head[:7]
+
+    ref = head[5:]
     try:
-        import subprocess
+        with open(os.path.join(git_dir, ref), 'r') as file:
+            return file.read().strip()[:7]
+    except FileNotFoundError:
+        # Ref only in packed-refs
+        with open(os.path.join(git_dir, 'packed-refs'), 'r') as file:
+            for line in file:
+                if line.rstrip().endswith(' ' + ref):
+                    return line[:7]
+    raise ValueError(f'{ref} not found')
 
-        __version__ = __version__ + '-' + subprocess.check_output(
-            ['git', 'log', '--format="%h"', '-n 1'],
-            stderr=subprocess.DEVNULL).decode("utf-8").rstrip().strip('"')
+
+if 'dev' in __version__:
+    try:
+        __version__ = __version__ + '-' + _git_revision()
 
     except Exception:  # pragma: no cover
-        # git not available, ignore
-        pass
\ No newline at end of file
+        # Not a git checkout, ignore
+        pass
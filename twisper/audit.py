@@ -0,0 +1,141 @@
+"""
+Audit log of engaged tweets, written as JSON lines from a background thread.
+"""
+import json
+import logging
+import os
+import sys
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import IO, Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the records on the queue
+_STOP = None
+
+
+class AuditLog:
+    """
+    Buffered JSON lines sink.
+
+    write() only enqueues the record, a writer thread batches records, flushes them
+    every `flush_interval` seconds (or `batch_size` records), optionally fsyncs, and
+    rotates the file once it grows over `max_bytes` or gets older than `rotate_interval`.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 1.0,
+                 fsync: bool = False, max_bytes: int = 10 * 1024 * 1024,
+                 rotate_interval: float = 0, backup_count: int = 5,
+                 echo: bool = False) -> None:
+        """
+        :param path: file to append to
+        :param batch_size: max records per write
+        :param flush_interval: max seconds a record waits before being written
+        :param fsync: fsync after every batch
+        :param max_bytes: rotate when the file gets bigger, 0 disables
+        :param rotate_interval: rotate after that many seconds, 0 disables
+        :param backup_count: rotated files to keep (path.1 ... path.N)
+        :param echo: also print every record to stdout
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.echo = echo
+
+        self._queue: Queue = Queue()
+        self._file: Optional[IO[str]] = None
+        self._opened_at = 0.0
+        self._thread = Thread(target=self._run, name='twisper-audit', daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """
+        Queue a record, never blocks on I/O
+        """
+        self._queue.put(record)
+
+    def close(self, timeout: Optional[float] = 5) -> None:
+        """
+        Write the pending records and stop the writer
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=timeout)
+
+    def _open(self) -> IO[str]:
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._opened_at = time.time()
+        return self._file
+
+    def _should_rotate(self) -> bool:
+        if self._file is None:
+            return False
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f'{self.path}.{i}'
+                if os.path.exists(src):
+                    os.replace(src, f'{self.path}.{i + 1}')
+            if os.path.exists(self.path):
+                os.replace(self.path, f'{self.path}.1')
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        lines = ''.join(json.dumps(x, separators=(',', ':'), default=str) + '\n' for x in batch)
+
+        file = self._open()
+        file.write(lines)
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+        if self.echo:
+            sys.stdout.write(lines)
+
+        if self._should_rotate():
+            self._rotate()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    logger.error(f'Failed to write {len(batch)} audit records: {e}')
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
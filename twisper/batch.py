@@ -0,0 +1,61 @@
+"""
+Batch validation over a whole epoch of search results.
+
+The per tweet checks of validate_tweet become masks over columnar arrays
+(numpy when installed, array.array otherwise), only the tweets surviving the
+cheap numeric masks go through the keyword matcher.
+
+There are no keyword (banned / retweet tag) mask columns: building them means
+matching every tweet of the batch, which costs more than the masks save. The
+matcher runs on the survivors instead, and its results are cached per text.
+"""
+from array import array
+from typing import List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+DAY = 24 * 3600
+
+
+class TweetColumns:
+    """
+    Columns of a batch of tweets, in the batch order
+    """
+    __slots__ = ('created_at', 'retweet_count')
+
+    def __init__(self, tweets: Sequence) -> None:
+        """
+        :param tweets: TweetRecords (anything with created_at and retweet_count)
+        """
+        # Epoch seconds
+        self.created_at = array('d', [x.created_at.timestamp() for x in tweets])
+        self.retweet_count = array('q', [x.retweet_count for x in tweets])
+
+    def __len__(self) -> int:
+        return len(self.retweet_count)
+
+
+def surviving_indices(created_at: Sequence[float], retweet_count: Sequence[int], now: float,
+                      max_age: float, min_retweets: int) -> List[int]:
+    """
+    Indices of the tweets passing the age and retweet count masks.
+    Same rules as validate_tweet: a tweet is too old once its age in whole days exceeds max_age.
+    :param created_at: epoch seconds per tweet
+    :param retweet_count: retweets per tweet
+    :param now: epoch seconds to compute ages from
+    :param max_age: max age in days
+    :param min_retweets: min retweet count
+    """
+    oldest = now - (max_age + 1) * DAY
+
+    if np is not None:
+        mask = (np.asarray(created_at, dtype=np.float64) > oldest) & \
+            (np.asarray(retweet_count, dtype=np.int64) >= min_retweets)
+        return np.flatnonzero(mask).tolist()
+
+    return [i for i, (created, count) in enumerate(zip(created_at, retweet_count))
+            if created > oldest and count >= min_retweets]
@@ -0,0 +1,62 @@
+"""
+Size bounded LRU cache with a time to live, used for hydrated API objects.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache. Entries expire `ttl` seconds after they were stored,
+    the least recently used entry is evicted once `max_size` is reached.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() - entry[0] > self._ttl:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """
+        :return: (cached values by key, keys missing from the cache)
+        """
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        for key in dict.fromkeys(keys):
+            value = self.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        return found, missing
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -9,31 +9,114 @@
 
 import json
 import logging 
+import os
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from twisper.enums import RunMode
+
+logger = logging.getLogger(__name__)
 
 CONFIG = 'config.json'
 
-class Config:
-    def __init__(self) -> None:
-        with open(CONFIG,'r') as file:
+# Sections every config file needs, the others are optional
+REQUIRED_SECTIONS = ('credentials', 'bot_config', 'notification_config', 'contact_config',
+                     'search_config', 'banned_config', 'timer_config')
+
+# Settings only read at startup, a reload keeps their current value
+RESTART_REQUIRED = ('data_dir', 'friend_file', 'seen_file', 'watermark_file', 'audit_file',
+                    'db_file', 'DRY_RUN', 'PIPELINE', 'PIPELINE_QUEUE_SIZE', 'STREAM', 'STREAM_URL',
+                    'RUN_MODE', 'API_KEY', 'API_KEY_SECRET', 'BEARER_TOKEN', 'ACCESS_TOKEN',
+                    'ACCESS_TOKEN_SECRET', 'UNFOLLOW_POLICY', 'METRICS_PORT', 'VERBOSITY',
+                    'LOGFILE', 'LOG_QUEUE', 'LOG_RATE_LIMIT', 'LOG_RATE_INTERVAL', 'SEEN_MAX_SIZE',
+                    'SEEN_MAX_AGE', 'CACHE_SIZE', 'CACHE_TTL', 'SEARCH_WORKERS', 'AUDIT_BATCH_SIZE',
+                    'AUDIT_FLUSH_INTERVAL', 'AUDIT_FSYNC', 'AUDIT_MAX_BYTES',
+                    'AUDIT_ROTATE_INTERVAL', 'AUDIT_BACKUP_COUNT', 'AUDIT_ECHO', 'RECHECK_SIZE',
+                    'HTTP_POOL_SIZE',
+                    'HTTP_RETRIES', 'HTTP_BACKOFF', 'HTTP_MAX_RETRY_WAIT', 'HTTP_DEFAULT_TIMEOUT',
+                    'HTTP_TIMEOUTS', 'PROFILING', 'CPROFILE_EVERY', 'CPROFILE_DIR', 'CONFIG_RELOAD')
+
+# Parsed config files by path, with the (mtime, size) they were read at
+_snapshots: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_snapshots_lock = Lock()
+
+
+def load_config_file(config_file: str) -> Dict[str, Any]:
+    """
+    Parse and validate a config file, reusing the last parse while the file is unchanged.
+    The returned dict is shared, don't modify it.
+    :param config_file: path to the json config
+    :raises ValueError: on invalid json or missing sections
+    """
+    stat = os.stat(config_file)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(config_file)
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+
+    with open(config_file, 'r') as file:
+        try:
             data = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'{config_file} is not valid json: {e}') from e
 
-        self.log_file = 'log.log'
+    missing = [x for x in REQUIRED_SECTIONS if x not in data]
+    if missing:
+        raise ValueError(f'{config_file} is missing the sections {", ".join(missing)}.')
 
-        self.friend_file = 'data/friends.txt'
-        
+    with _snapshots_lock:
+        _snapshots[config_file] = (version, data)
+    return data
 
 
+class Config:
+    def __init__(self, config_file: str = CONFIG) -> None:
+        data = load_config_file(config_file)
+
+        self.config_file = config_file
+
         # Config sections
         credentials = data['credentials']
         bot = data['bot_config']
+
+        # Each account needs its own data_dir when several run side by side
+        self.data_dir = bot.get('data_dir', 'data')
+
+        self.log_file = 'log.log'
+
+        self.friend_file = os.path.join(self.data_dir, 'friends.txt')
+        self.seen_file = os.path.join(self.data_dir, 'retweeted.txt')
+        self.watermark_file = os.path.join(self.data_dir, 'watermarks.json')
+        self.audit_file = os.path.join(self.data_dir, 'myfile.txt')
+        self.db_file = os.path.join(self.data_dir, 'twisper.sqlite')
+
         notifications = data['notification_config']
         contact = data['contact_config']
         search = data['search_config']
         banned = data['banned_config']
         timers = data['timer_config']
+        audit = data.get('audit_config', {})
+        http = data.get('http_config', {})
+        profiling = data.get('profiling_config', {})
+        priority = data.get('priority_config', {})
 
         ### DRY RUN ONLY - no retweets/follows/DMS
         self.DRY_RUN = bot['dry_run']
+        # State the bot starts in (running / stopped)
+        self.INITIAL_STATE = bot.get('initial_state', 'running')
+        # Run search, filtering and actions as concurrent pipeline stages (see twisper/pipeline.py)
+        self.PIPELINE = bot.get('pipeline', False)
+        # Max number of tweets waiting between two pipeline stages, or for the stream handler
+        self.PIPELINE_QUEUE_SIZE = bot.get('pipeline_queue_size', 1000)
+        # Ingest tweets from the filtered stream instead of polling the search (see twisper/stream.py)
+        self.STREAM = bot.get('stream', False)
+        self.STREAM_URL = bot.get('stream_url', 'https://stream.twitter.com/1.1/statuses/filter.json')
+        # Streamed tweets have no epochs, save the seen ids, friends and ledger this often (seconds)
+        self.STREAM_SAVE_INTERVAL = bot.get('stream_save_interval', 60)
+        # Actions are only simulated in dry run, whatever the ingestion mode
+        self.RUN_MODE = RunMode.STREAM if self.STREAM else \
+            RunMode.DRY_RUN if self.DRY_RUN else RunMode.LIVE
 
         # Don't start the bot if friends weren't correctly retrieved
         self.wait_retrieve = False
@@ -52,9 +135,34 @@ class Config:
         '''
         self.MAX_RESULTS = bot['max_results']
         self.FOLLOW_LIMIT = bot['follow_limit']
+        # Who to unfollow first at the follow limit: fifo, lru or giveaway_ended
+        self.UNFOLLOW_POLICY = bot.get('unfollow_policy', 'fifo')
         self.MAX_AGE = bot['max_tweet_age'] # days
         self.MIN_RT_COUNT = bot['min_retweet_count']
         self.HEARTBEAT_INTERVAL = bot['heartbeat_interval']
+        # Serve Prometheus metrics on this port (0 disables)
+        self.METRICS_PORT = bot.get('metrics_port', 0)
+        # Apply changes to the config file between epochs, see ConfigWatcher
+        self.CONFIG_RELOAD = bot.get('config_reload', True)
+        # Logging: 0 = info, 1+ = debug. logfile can be a path or syslog[:address]
+        # Under the supervisor the default logfile goes to each account's data_dir
+        self.VERBOSITY = bot.get('verbosity', 0)
+        self.LOGFILE = bot.get('logfile', self.log_file)
+        # Run log handlers on a background thread
+        self.LOG_QUEUE = bot.get('log_queue', True)
+        # Max similar info/debug messages per interval (seconds), 0 disables
+        self.LOG_RATE_LIMIT = bot.get('log_rate_limit', 10)
+        self.LOG_RATE_INTERVAL = bot.get('log_rate_interval', 60)
+        # How many already handled tweet ids to remember, and for how long (days)
+        self.SEEN_MAX_SIZE = bot.get('seen_max_size', 100000)
+        self.SEEN_MAX_AGE = bot.get('seen_max_age', self.MAX_AGE)
+        # How many tweets to keep hydrated, and for how long (seconds)
+        self.CACHE_SIZE = bot.get('cache_size', 10000)
+        self.CACHE_TTL = bot.get('cache_ttl', 3600)
+        # How many recent giveaways short of min_retweet_count to look up again later,
+        # and how often (seconds)
+        self.RECHECK_SIZE = bot.get('recheck_size', 1000)
+        self.RECHECK_INTERVAL = bot.get('recheck_interval', 900)
 
         '''
         Notification config
@@ -76,6 +184,7 @@ class Config:
         ''' 
         # Twitter search config
         # DON'T WRITE ANYTHING IN CAPS, AS THE BOT AUTOMATICALLY FLATTERS ALL INPUT TEXTS. THUS ANY WORD WITH CAPS WON'T BE RECOGNIZED
+        # Tags are matched as whole words (see twisper/matcher.py), "rt" matches "RT!" but not "start"
         # Tags that Twitter will use to look up our tweets. Really important as all the script will be based on them
         self.TAGS_SEARCH  = search["tags_search" ]
         # What words will the bot check in order to retweet a tweet. It's important because if the bot doesnt
@@ -88,18 +197,23 @@ class Config:
         self.TAGS_FOLLOW = search["tags_follow"]
         # What words will the bot look for in order to like a tweet (it also needs to contain a retweet tag)
         self.TAGS_LIKE = search["tags_like"]
+        # How many searches can run at the same time, 1 searches the tags one after another
+        self.SEARCH_WORKERS = search.get("search_workers", 4)
+        # How many pages of max_results tweets to fetch per tag, only tweets newer than the last search are requested
+        self.SEARCH_MAX_PAGES = search.get("max_pages", 3)
 
         '''
         Banned config
         '''
-        #Ignore tweets that contain any of these words
+        #Ignore tweets that contain any of these words, matched as word prefixes: "nude" also blocks "nudes",
+        # "hot" blocks "hottest" but not "shot" (see twisper/matcher.py)
         self.BANNED_KEYWORDS =banned["keywords"]
         # Add to this list all the users whose contests (actually tweets that contain retweet_tags keywords) the script will
         # always skip (this is for the user's username, not name!) (username is the @ one)
         # Variables related to avoiding users don't need to have a value
-        self.BANNED_USERS = banned["users" ]
+        self.BANNED_USERS = frozenset(x.lower() for x in banned["users" ])
         # Same but but in this case applied to the author's name
-        self.BANNED_NAME_KEYWORDS = banned["name_keywords" ]
+        self.BANNED_NAME_KEYWORDS = tuple(x.lower() for x in banned["name_keywords" ])
 
         '''
         Timer config
@@ -114,18 +228,126 @@ class Config:
         self.TIMER_MSG=timers["msg_timer" ]
         # How long to wait after following someone. 1st time the diff is added, afterwards the entire rate is added to the sleep
         self.TIMER_FOLLOW=timers["follow_timer"]
+        # The sleep adapts to how many new tweets each epoch finds (see EpochPacer in twisper/scheduler.py)
+        # min/max 0 mean: min from the search quota, max 10 x sleep_timer (at least 10 minutes)
+        self.MIN_SLEEP = timers.get("min_sleep_timer", 0)
+        self.MAX_SLEEP = timers.get("max_sleep_timer", 0)
+        self.TARGET_NEW_TWEETS = timers.get("target_new_tweets", 50)
+        # First wait after an error, doubled (with jitter) on every consecutive error
+        self.ERROR_BACKOFF = timers.get("error_backoff", 30)
+        # Per action rate limits, {"retweet": {"limit": 300, "window": 10800, "burst": 5}, ...}
+        # Actions without an entry get one token every timer seconds from above
+        self.RATE_LIMITS = timers.get("rate_limits", {})
+    
+        '''
+        Priority config
+        '''
+        # Queued actions run best first: weights of log(1 + retweets), log(1 + author followers)
+        # and a bonus per action asked for (retweet, follow, like, message), see twisper/ranking.py
+        self.PRIORITY_RETWEETS = priority.get('retweets', 1.0)
+        self.PRIORITY_FOLLOWERS = priority.get('followers', 0.5)
+        self.PRIORITY_TAGS = priority.get('tags', 1.0)
+        # A tweet is worth half as much every half_life hours
+        self.PRIORITY_HALF_LIFE = priority.get('half_life', 24)
+        # Actions still queued after max_wait seconds (or once the giveaway ended) are dropped
+        self.ACTION_MAX_WAIT = priority.get('max_wait', 6 * 3600)
+
+        '''
+        Audit config
+        '''
+        # Engaged tweets are written as JSON lines to audit_file by a background thread
+        self.AUDIT_BATCH_SIZE = audit.get('batch_size', 100)
+        self.AUDIT_FLUSH_INTERVAL = audit.get('flush_interval', 1.0)
+        self.AUDIT_FSYNC = audit.get('fsync', False)
+        # Rotate when the file gets bigger than max_bytes or older than rotate_interval seconds (0 disables)
+        self.AUDIT_MAX_BYTES = audit.get('max_bytes', 10 * 1024 * 1024)
+        self.AUDIT_ROTATE_INTERVAL = audit.get('rotate_interval', 0)
+        self.AUDIT_BACKUP_COUNT = audit.get('backup_count', 5)
+        # Print every audit record to stdout too
+        self.AUDIT_ECHO = audit.get('echo', False)
+
+        '''
+        HTTP config
+        '''
+        # Connections kept alive to the API, should cover search_workers + action threads
+        self.HTTP_POOL_SIZE = http.get('pool_size', max(self.SEARCH_WORKERS + 4, 10))
+        # Retries on 429/5xx, waiting for the rate limit reset up to max_retry_wait seconds
+        self.HTTP_RETRIES = http.get('retries', 3)
+        self.HTTP_BACKOFF = http.get('backoff_factor', 1.0)
+        self.HTTP_MAX_RETRY_WAIT = http.get('max_retry_wait', 60)
+        # [connect, read] timeouts in seconds, per endpoint path fragment
+        self.HTTP_DEFAULT_TIMEOUT = http.get('default_timeout', [5, 30])
+        self.HTTP_TIMEOUTS = http.get('timeouts', {})
+
+        '''
+        Profiling config
+        '''
+        # Time search, validation, hydration, actions and sleep, percentiles are logged with the heartbeat
+        self.PROFILING = profiling.get('enabled', False)
+        # Run every Nth epoch under cProfile and dump it to cprofile_dir (0 disables)
+        self.CPROFILE_EVERY = profiling.get('cprofile_every', 0)
+        self.CPROFILE_DIR = profiling.get('cprofile_dir', os.path.join(self.data_dir, 'profiles'))
     
     def set_up_logger(self):
-        #logging.basicConfig(format='%(asctime)s : %(levelname)s: %(message)s', 
-                            # filename=self.log_file, filemode='w', 
-                            # level=logging.INFO)
+        """
+        Set up logging from config, see twisper.loggers.setup_logging
+        """
+        from twisper.loggers import setup_logging
+
+        setup_logging(self)
+
+        return logging.getLogger('twisper')
+
+
+class ConfigWatcher:
+    """
+    Polls the config file's mtime and builds a new Config when it changed.
+    Settings in RESTART_REQUIRED keep their current value.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self._version = self._stat()
+        self._callbacks: List[Callable[[Config], None]] = []
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def subscribe(self, callback: Callable[[Config], None]) -> None:
+        """
+        :param callback: called with the new Config after every reload
+        """
+        self._callbacks.append(callback)
+
+    def poll(self) -> bool:
+        """
+        Reload the config if the file changed, an invalid file keeps the current config
+        :return: True if a new config was applied
+        """
+        version = self._stat()
+        if version is None or version == self._version:
+            return False
+        self._version = version
 
-        logger = logging.getLogger(__name__)
+        config_file = self.config.config_file
+        try:
+            config = Config(config_file)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f'Not reloading {config_file}, keeping the current config: {e!r}')
+            return False
 
-        logger.setLevel(logging.DEBUG)
-        fh = logging.FileHandler(self.log_file)
-        fh.setLevel(logging.DEBUG)
-        logger.addHandler(fh)
+        changed = [x for x in RESTART_REQUIRED if getattr(config, x) != getattr(self.config, x)]
+        if changed:
+            logger.warning(f'Restart to apply the changes to {", ".join(changed)}.')
+        for name in RESTART_REQUIRED:
+            setattr(config, name, getattr(self.config, name))
 
-        
-        return logger
+        self.config = config
+        for callback in self._callbacks:
+            callback(config)
+        logger.info(f'Reloaded {config_file}.')
+        return True
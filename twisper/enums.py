@@ -18,6 +18,7 @@ class RunMode(Enum):
     """
     LIVE = "life"
     DRY_RUN = "dry_run"
+    STREAM = "stream"
 
     def __str__(self):
         return f"{self.name.lower()}"
@@ -30,7 +31,48 @@ class TimerType(Enum):
     FOLLOW = "follow"
     LIKE = "like"
     MESSAGE = "message"
+    UNFOLLOW = "unfollow"
     EPOCH = "epoch"
 
     def __str__(self):
         return f"{self.name.lower()}"
+
+
+class ActionType(Enum):
+    """
+    Actions recorded in the ledger
+    """
+    RETWEET = "retweet"
+    LIKE = "like"
+    FOLLOW = "follow"
+    UNFOLLOW = "unfollow"
+    MESSAGE = "message"
+
+    def __str__(self):
+        return f"{self.name.lower()}"
+
+
+class EvictionPolicy(Enum):
+    """
+    Which friends get unfollowed first once at the follow limit
+    """
+    FIFO = "fifo"
+    LRU = "lru"
+    GIVEAWAY_ENDED = "giveaway_ended"
+
+    def __str__(self):
+        return f"{self.name.lower()}"
+
+
+class ErrorKind(Enum):
+    """
+    Classified Twitter API errors
+    """
+    ALREADY_DONE = "already_done"
+    RATE_LIMITED = "rate_limited"
+    FORBIDDEN = "forbidden"
+    TRANSIENT = "transient"
+    OTHER = "other"
+
+    def __str__(self):
+        return f"{self.name.lower()}"
@@ -0,0 +1,95 @@
+"""
+Unfollow order: a heap of friends keyed by follow time, last interaction or giveaway end.
+"""
+import heapq
+import itertools
+import logging
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from twisper.enums import EvictionPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+class Evictor:
+    """
+    Picks the friends to unfollow first, in O(log n) per operation.
+
+    - FIFO: oldest follow first
+    - LRU: least recent interaction (follow, retweet...) first
+    - GIVEAWAY_ENDED: friends whose giveaway ended first, then oldest follow
+
+    Updates push a new heap entry, outdated entries are skipped when popped.
+    """
+
+    def __init__(self, policy: EvictionPolicy = EvictionPolicy.FIFO) -> None:
+        self.policy = policy
+        self._heap: List[Tuple[float, int, str]] = []
+        self._keys: Dict[str, float] = {}
+        self._counter = itertools.count()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, screen_name) -> bool:
+        return screen_name.lower() in self._keys
+
+    def _push(self, name: str, key: float) -> None:
+        self._keys[name] = key
+        heapq.heappush(self._heap, (key, next(self._counter), name))
+
+        # Don't let outdated entries pile up
+        if len(self._heap) > 2 * len(self._keys) + 1024:
+            self._heap = [(k, i, n) for k, i, n in self._heap if self._keys.get(n) == k]
+            heapq.heapify(self._heap)
+
+    def add(self, screen_name: str, followed_at: float,
+            giveaway_end: Optional[float] = None) -> None:
+        """
+        Track a friend
+        :param followed_at: follow timestamp
+        :param giveaway_end: timestamp after which the giveaway we followed for is over
+        """
+        name = screen_name.lower()
+        key = followed_at
+        if self.policy == EvictionPolicy.GIVEAWAY_ENDED and giveaway_end is not None:
+            key = giveaway_end
+
+        with self._lock:
+            current = self._keys.get(name)
+            if current is None or key > current:
+                self._push(name, key)
+
+    def touch(self, screen_name: str, ts: float, giveaway_end: Optional[float] = None) -> None:
+        """
+        Register an interaction with an already tracked friend
+        """
+        name = screen_name.lower()
+        with self._lock:
+            current = self._keys.get(name)
+            if current is None:
+                return
+            if self.policy == EvictionPolicy.LRU and ts > current:
+                self._push(name, ts)
+            elif self.policy == EvictionPolicy.GIVEAWAY_ENDED and giveaway_end is not None \
+                    and giveaway_end > current:
+                self._push(name, giveaway_end)
+
+    def remove(self, screen_name: str) -> None:
+        with self._lock:
+            self._keys.pop(screen_name.lower(), None)
+
+    def pop(self) -> Optional[str]:
+        """
+        Remove and return the friend to unfollow next, None if there are none
+        """
+        with self._lock:
+            while self._heap:
+                key, _, name = heapq.heappop(self._heap)
+                if self._keys.get(name) == key:
+                    del self._keys[name]
+                    return name
+        return None
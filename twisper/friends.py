@@ -0,0 +1,153 @@
+"""
+Local copy of the accounts the bot follows.
+"""
+import logging
+import os
+import random
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class FriendStore:
+    """
+    Set of followed screen names with O(1) membership, insert, removal and random pick.
+
+    Names live in a list plus a name -> position map, removal swaps the last entry
+    into the freed slot. The store is cached as one "<user id> <screen name>" line
+    per friend, so restarts only need to sync the differences with Twitter.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._names: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._ids: Dict[str, Optional[int]] = {}
+        self._lock = Lock()
+
+        if self._path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, screen_name) -> bool:
+        return screen_name is not None and screen_name.lower() in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._names))
+
+    def add(self, screen_name: str, user_id: Optional[int] = None) -> bool:
+        """
+        :return: True if screen_name was not a friend yet
+        """
+        name = screen_name.lower()
+        with self._lock:
+            if user_id is not None or name not in self._ids:
+                self._ids[name] = user_id
+            if name in self._index:
+                return False
+            self._index[name] = len(self._names)
+            self._names.append(name)
+        return True
+
+    def remove(self, screen_name: str) -> bool:
+        """
+        :return: True if screen_name was a friend
+        """
+        name = screen_name.lower()
+        with self._lock:
+            pos = self._index.pop(name, None)
+            if pos is None:
+                return False
+            last = self._names.pop()
+            if pos < len(self._names):
+                self._names[pos] = last
+                self._index[last] = pos
+            self._ids.pop(name, None)
+        return True
+
+    def random(self) -> Optional[str]:
+        """
+        Random friend, None if there are none
+        """
+        with self._lock:
+            return random.choice(self._names) if self._names else None
+
+    def user_ids(self) -> Dict[int, str]:
+        """
+        Known user ids, mapped to their screen name
+        """
+        with self._lock:
+            return {v: k for k, v in self._ids.items() if v is not None}
+
+    def unresolved(self) -> List[str]:
+        """
+        Friends stored without a user id
+        """
+        with self._lock:
+            return [k for k, v in self._ids.items() if v is None]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._names.clear()
+            self._index.clear()
+            self._ids.clear()
+
+    def load(self) -> None:
+        """
+        Load the cached friends, lines without a user id are kept by name only
+        """
+        if not self._path or not os.path.exists(self._path):
+            return
+
+        with open(self._path, 'r') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2 and parts[0].isdigit():
+                    self.add(parts[1], int(parts[0]))
+                elif len(parts) == 1:
+                    self.add(parts[0])
+
+        logger.info(f'Loaded {len(self)} friends from {self._path}.')
+
+    def save(self) -> None:
+        if not self._path:
+            return
+
+        with self._lock:
+            lines = [f'{self._ids.get(x) or ""} {x}\n'.lstrip() for x in self._names]
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.writelines(lines)
+        os.replace(tmp_path, self._path)
+
+    def sync(self, api) -> None:
+        """
+        Bring the store in line with Twitter.
+        Only the friend ids are listed, users are looked up for new ids only.
+        :param api: T_API
+        """
+        friend_ids = set(api.get_friend_ids())
+        known = self.user_ids()
+
+        removed = [name for user_id, name in known.items() if user_id not in friend_ids]
+        for name in removed:
+            self.remove(name)
+
+        # Entries stored without an id get it from the lookup of the new ids
+        added = [x for x in friend_ids if x not in known]
+        for user in api.lookup_users(added):
+            self.add(user.screen_name, user.id)
+
+        # The ones still without an id are not followed anymore
+        unresolved = self.unresolved()
+        for name in unresolved:
+            self.remove(name)
+        removed += unresolved
+
+        logger.info(f'Synced friends: {len(self)} total, +{len(added)} / -{len(removed)}.')
+        self.save()
@@ -1,23 +1,75 @@
+import atexit
 import logging
+import re
 import sys
+import time
+from collections import deque
 from logging import Formatter
-from logging.handlers import BufferingHandler, RotatingFileHandler, SysLogHandler
+from logging.handlers import (BufferingHandler, QueueHandler, QueueListener,
+                              RotatingFileHandler, SysLogHandler)
+from queue import SimpleQueue
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
 
 from twisper.config import Config
 
 
 class FTBufferingHandler(BufferingHandler):
+    """
+    Keeps the last `capacity` records in a ring buffer, the oldest record is
+    dropped on every append once full - no copying, no moments with "empty" logs.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__(capacity)
+        self.buffer = deque(maxlen=capacity)  # type: ignore[assignment]
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return False
+
     def flush(self):
         """
-        Override Flush behaviour - we keep half of the configured capacity
-        otherwise, we have moments with "empty" logs.
+        Nothing to do, the ring buffer drops old records by itself
         """
-        self.acquire()
-        try:
-            # Keep half of the records in buffer.
-            self.buffer = self.buffer[-int(self.capacity / 2):]
-        finally:
-            self.release()
+        pass
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `rate` similar records through per `interval` seconds.
+    Records are similar if their messages only differ in numbers ("Retweeted 123"
+    and "Retweeted 456"). Warnings and errors are never dropped.
+    """
+
+    _digits = re.compile(r'\d+')
+
+    def __init__(self, rate: int = 10, interval: float = 60) -> None:
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self._windows: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+
+        key = (record.name, self._digits.sub('#', str(record.msg)))
+        now = time.monotonic()
+        with self._lock:
+            # [window start, records let through, records suppressed]
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = int(window[2]) if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+                return True
+            if window[1] < self.rate:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
 
 
 logger = logging.getLogger(__name__)
@@ -27,6 +79,9 @@ LOGFORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 bufferHandler = FTBufferingHandler(1000)
 bufferHandler.setFormatter(Formatter(LOGFORMAT))
 
+# Runs the file / syslog handlers on its own thread when queued logging is enabled
+_listener: Optional[QueueListener] = None
+
 
 def _set_loggers(verbosity: int = 0, api_verbosity: str = 'info') -> None:
     """
@@ -72,15 +127,27 @@ def setup_logging_pre() -> None:
     )
 
 
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 def setup_logging(config: Config) -> None:
     """
-    Process -v/--verbose, --logfile options
+    Process verbosity and logfile options.
+    With config.LOG_QUEUE the root logger only gets a QueueHandler, the file / syslog
+    handlers run on a QueueListener thread so no log call waits on I/O.
     """
+    global _listener
+
     # Log level
-    verbosity = config['verbosity']
+    verbosity = config.VERBOSITY
     logging.root.addHandler(bufferHandler)
 
-    logfile = config.get('logfile')
+    logfile = config.LOGFILE
+    handlers: List[logging.Handler] = []
 
     if logfile:
         s = logfile.split(':')
@@ -99,7 +166,7 @@ def setup_logging(config: Config) -> None:
             # to perform reduction of repeating messages if this is set in the
             # syslog config. The messages should be equal for this.
             handler_sl.setFormatter(Formatter('%(name)s - %(levelname)s - %(message)s'))
-            logging.root.addHandler(handler_sl)
+            handlers.append(handler_sl)
         else:
             handler_rf = get_existing_handlers(RotatingFileHandler)
             if handler_rf:
@@ -108,9 +175,38 @@ def setup_logging(config: Config) -> None:
                                              maxBytes=1024 * 1024 * 10,  # 10Mb
                                              backupCount=10)
             handler_rf.setFormatter(Formatter(LOGFORMAT))
-            logging.root.addHandler(handler_rf)
+            handlers.append(handler_rf)
+
+    rate_filter = RateLimitFilter(config.LOG_RATE_LIMIT, config.LOG_RATE_INTERVAL)
+
+    if config.LOG_QUEUE:
+        _stop_listener()
+        handler_q = get_existing_handlers(QueueHandler)
+        if handler_q:
+            logging.root.removeHandler(handler_q)
+
+        # The stderr handler moves behind the queue too
+        handler_se = next((h for h in logging.root.handlers
+                           if type(h) is logging.StreamHandler), None)
+        if handler_se:
+            logging.root.removeHandler(handler_se)
+            handlers.append(handler_se)
+
+        queue: SimpleQueue = SimpleQueue()
+        handler_q = QueueHandler(queue)
+        handler_q.addFilter(rate_filter)
+        logging.root.addHandler(handler_q)
+
+        _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.unregister(_stop_listener)
+        atexit.register(_stop_listener)
+    else:
+        for handler in handlers:
+            handler.addFilter(rate_filter)
+            logging.root.addHandler(handler)
 
     logging.root.setLevel(logging.INFO if verbosity < 1 else logging.DEBUG)
-    _set_loggers(verbosity, config.get('api_server', {}).get('verbosity', 'info'))
+    _set_loggers(verbosity)
 
-    logger.info('Verbosity set to %s', verbosity)
\ No newline at end of file
+    logger.info('Verbosity set to %s', verbosity)
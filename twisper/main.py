@@ -1,13 +1,13 @@
-import requests
-import json
 import logging
 import sys
 from twisper.config  import Config
-from twisper.twitter_api import T_API
-from time import sleep
-from typing import Any
+from twisper.profiling import profiler
+from twisper.scheduler import pacer_from_config
+from twisper.twisper import TwisperBot
+from twisper.worker import Worker
+from time import sleep, time
+from typing import Any, Optional
 
-import tweepy
 from twisper.loggers import setup_logging_pre
 
 # check min. python version
@@ -24,6 +24,7 @@ def main():
     """
 
     return_code: Any = 1
+    api: Optional[TwisperBot] = None
 
     try:
         setup_logging_pre()
@@ -32,53 +33,42 @@ def main():
 
         logger = config.set_up_logger()
 
-        api = T_API(config=config, log=logger)
+        if config.PIPELINE or config.STREAM:
+            # Search (or stream), filtering and actions run concurrently, driven by the worker state machine
+            worker = Worker(config)
+            try:
+                worker.run()
+            finally:
+                worker.exit()
+            return_code = 0
+            return
 
-        run = True
+        api = TwisperBot(config)
+        pacer = pacer_from_config(config)
+        if api.watcher is not None:
+            api.watcher.subscribe(lambda x: pacer.update(pacer_from_config(x)))
 
-        tweets_engaged = 0
-        errors_returned = 0
         epoch = 1
 
-        while run:
-            tweets_engaged = 0
+        while True:
+            epoch_start = time()
             try:
                 print(f'Starting epoch: {epoch}')
-                # Search tweets
-                tweet_list = api.search_tweets()
-
-                # Process tweets
-                for tweet in tweet_list:
-                    # Validate tweet
-                    if not api.validate_tweet(tweet):
-                        continue
-                    
-                    # # Verify original
-                    tweet = api.original_tweet(tweet)
-                    if tweet is None:
-                        continue
-
-                    # Verify not using banned words
-                    if api.is_banned_user(tweet):
-                        continue
-
-                    # Everything seems good, lets get to work
-                    if api.engage(tweet):
-                        tweets_engaged += 1
-                    else:
-                        errors_returned += 1
-                
+                with profiler.epoch():
+                    # Search, validate the whole batch and engage, best giveaways first
+                    tweets_engaged, tweets_searched = api.process()
+
                 epoch += 1
-                logger.info(f'Finished analyzing (epoch {epoch}). Engaged with {tweets_engaged}/{str(len(tweet_list))} tweets.')
+                logger.info(f'Finished analyzing (epoch {epoch}). Engaged with {tweets_engaged}/{tweets_searched} tweets.')
+                pacer.success(tweets_searched)
             except Exception as e:
                 logger.error(str(e))
-                sleep(100 * len(config.TAGS_SEARCH))
-
-            sleep(2 * len(config.TAGS_SEARCH))
+                pacer.failure()
 
-            if errors_returned > 1:
-                print('something happened, exiting')
-                run = False
+            if profiler.enabled:
+                logger.debug(profiler.summary())
+            with profiler.stage('sleep'):
+                sleep(pacer.sleep_for(time() - epoch_start))
     except SystemExit as e:  # pragma: no cover
         return_code = e
     except KeyboardInterrupt:
@@ -87,6 +77,10 @@ def main():
     except Exception:
         logger.exception('Fatal exception!')
     finally:
+        if api is not None:
+            # Queued actions, then the buffered ledger rows and audit records
+            api._schedule.drain(timeout=config.TIMER_SLEEP)
+            api.cleanup()
         sys.exit(return_code)
 
 
@@ -0,0 +1,113 @@
+"""
+Keyword matcher used to classify tweet texts in a single pass.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional, Pattern, Set, Tuple
+
+from twisper.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Characters that are considered part of a word. An action tag only matches when it is
+# not directly preceded or followed by one of these, so "rt" matches "rt!" and
+# "#rt" but never "start" or "article". Banned keywords only need the left boundary,
+# they match as word prefixes: "nude" blocks "nudes", "hot" blocks "hottest" but not "shot".
+WORD_CHARS = r'a-z0-9_'
+
+MATCH_CACHE_SIZE = 4096
+
+
+class TweetMatch(NamedTuple):
+    """
+    Keywords found in a tweet text, grouped by category
+    """
+    banned: Tuple[str, ...] = ()
+    rt: Tuple[str, ...] = ()
+    msg: Tuple[str, ...] = ()
+    follow: Tuple[str, ...] = ()
+    like: Tuple[str, ...] = ()
+
+
+CATEGORIES = TweetMatch._fields
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Normalize a text before matching. Config keywords go through the same function.
+    """
+    return (text or '').lower()
+
+
+def _compile(keywords: Iterable[str], whole_word: bool = True) -> Optional[Pattern]:
+    """
+    Build a single alternation regex for all keywords.
+    Longer keywords come first, so the longest keyword wins at a given position.
+    :param whole_word: also require a word boundary after the keyword, else match prefixes
+    :return: compiled pattern, None if there is nothing to match
+    """
+    words = sorted({normalize(x) for x in keywords if x}, key=len, reverse=True)
+    if not words:
+        return None
+
+    alternation = '|'.join(re.escape(x) for x in words)
+    right = f'(?![{WORD_CHARS}])' if whole_word else ''
+    return re.compile(f'(?<![{WORD_CHARS}])(?:{alternation}){right}')
+
+
+class KeywordMatcher:
+    """
+    Matches tweet texts against all configured keyword lists at once.
+
+    Action tags match whole words, banned keywords match word prefixes (see WORD_CHARS).
+    The text is normalized once and scanned once per rule, no matter how many keywords
+    are configured.
+    """
+
+    def __init__(self, config: Config, cache_size: int = MATCH_CACHE_SIZE) -> None:
+        """
+        Build the matcher from config
+        :param config: bot config holding the keyword lists
+        :param cache_size: number of texts to keep results for
+        """
+        self._banned = {normalize(x) for x in config.BANNED_KEYWORDS if x}
+        lists = {
+            'rt': config.TAGS_RT,
+            'msg': config.TAGS_MSG,
+            'follow': config.TAGS_FOLLOW,
+            'like': config.TAGS_LIKE,
+        }
+
+        # A keyword can be part of several lists
+        self._categories: Dict[str, Set[str]] = {}
+        for category, keywords in lists.items():
+            for keyword in keywords:
+                self._categories.setdefault(normalize(keyword), set()).add(category)
+
+        self._pattern = _compile(self._categories)
+        self._banned_pattern = _compile(self._banned, whole_word=False)
+
+        # validate_tweet, original_tweet and engage all look at the same texts
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+        logger.debug(f'Keyword matcher built with {len(self._categories)} tags and '
+                     f'{len(self._banned)} banned keywords.')
+
+    def _match(self, text: Optional[str]) -> TweetMatch:
+        """
+        Scan text once and return the keywords found per category
+        :param text: raw tweet text
+        :return: TweetMatch
+        """
+        text = normalize(text)
+        found: Dict[str, list] = {x: [] for x in CATEGORIES}
+        if self._pattern is not None:
+            for keyword in dict.fromkeys(self._pattern.findall(text)):
+                for category in self._categories[keyword]:
+                    found[category].append(keyword)
+        if self._banned_pattern is not None:
+            found['banned'] = list(dict.fromkeys(self._banned_pattern.findall(text)))
+
+        return TweetMatch(**{k: tuple(v) for k, v in found.items()})
@@ -0,0 +1,173 @@
+"""
+Action ledger: every retweet, like, follow, unfollow and DM, stored in SQLite.
+"""
+import logging
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+from twisper.enums import ActionType
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    action TEXT NOT NULL,
+    tweet_id INTEGER,
+    user_id INTEGER,
+    screen_name TEXT,
+    ts REAL NOT NULL,
+    dry_run INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_actions_tweet_id ON actions (tweet_id, action);
+CREATE INDEX IF NOT EXISTS ix_actions_user_id ON actions (user_id, action);
+CREATE INDEX IF NOT EXISTS ix_actions_screen_name ON actions (screen_name, action, ts);
+CREATE INDEX IF NOT EXISTS ix_actions_action_ts ON actions (action, ts);
+"""
+
+Row = Tuple[str, Optional[int], Optional[int], Optional[str], float, int]
+
+
+class Ledger:
+    """
+    Records actions and answers "was this already done" before the API is called.
+
+    Writes are buffered and committed in one transaction per epoch (flush), or as soon as
+    max_pending rows are waiting. Pending rows are already taken into account by the queries.
+    """
+
+    def __init__(self, db_file: str, dry_run: bool = False, max_pending: int = 1000) -> None:
+        """
+        :param db_file: sqlite database path, ':memory:' for a throwaway ledger
+        :param dry_run: simulated actions are kept apart from live ones
+        :param max_pending: buffered rows that trigger a flush
+        """
+        self._dry_run = int(bool(dry_run))
+        self._max_pending = max_pending
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = Lock()
+        self._pending: List[Row] = []
+        # (action, column, value) of pending rows, per tweet_id, user_id and screen_name
+        self._pending_keys: Set[Tuple[str, str, object]] = set()
+        # Last pending follow / unfollow per screen name
+        self._pending_follows: Dict[str, str] = {}
+
+    def record(self, action: ActionType, tweet_id: Optional[int] = None,
+               user_id: Optional[int] = None, screen_name: Optional[str] = None) -> None:
+        """
+        Buffer an action, written on the next flush
+        """
+        name = screen_name.lower() if screen_name else None
+        row = (action.value, tweet_id, user_id, name, time.time(), self._dry_run)
+        with self._lock:
+            self._pending.append(row)
+            for column, value in (('tweet_id', tweet_id), ('user_id', user_id),
+                                  ('screen_name', name)):
+                if value is not None:
+                    self._pending_keys.add((action.value, column, value))
+            if name is not None and action in (ActionType.FOLLOW, ActionType.UNFOLLOW):
+                self._pending_follows[name] = action.value
+            if len(self._pending) >= self._max_pending:
+                self._flush()
+
+    def flush(self) -> int:
+        """
+        Write buffered actions in a single transaction
+        :return: number of rows written
+        """
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        rows, self._pending = self._pending, []
+        self._pending_keys = set()
+        self._pending_follows = {}
+        if not rows:
+            return 0
+        with self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT INTO actions (action, tweet_id, user_id, screen_name, ts, dry_run) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def _exists(self, action: ActionType, column: str, value: object) -> bool:
+        with self._lock:
+            if (action.value, column, value) in self._pending_keys:
+                return True
+            cursor = self._conn.execute(
+                f'SELECT 1 FROM actions WHERE {column} = ? AND action = ? AND dry_run = ? LIMIT 1',
+                (value, action.value, self._dry_run))
+            return cursor.fetchone() is not None
+
+    def has_tweet(self, action: ActionType, tweet_id: int) -> bool:
+        """
+        Check if the action was already done on a tweet (retweet, like)
+        """
+        return self._exists(action, 'tweet_id', tweet_id)
+
+    def has_user(self, action: ActionType, user_id: int) -> bool:
+        """
+        Check if the action was already done on a user (message)
+        """
+        return self._exists(action, 'user_id', user_id)
+
+    def _last_follows(self) -> Dict[str, Tuple[str, float]]:
+        """
+        Latest follow / unfollow per screen name, pending rows included
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT screen_name, action, MAX(ts) FROM actions '
+                'WHERE action IN (?, ?) AND dry_run = ? AND screen_name IS NOT NULL '
+                'GROUP BY screen_name',
+                (ActionType.FOLLOW.value, ActionType.UNFOLLOW.value, self._dry_run))
+            last = {name: (action, ts) for name, action, ts in cursor}
+            for action, _, _, name, ts, _ in self._pending:
+                if name is not None and action in (ActionType.FOLLOW.value,
+                                                   ActionType.UNFOLLOW.value):
+                    last[name] = (action, ts)
+        return last
+
+    def is_following(self, screen_name: str) -> bool:
+        """
+        Check if the last follow action on screen_name was a follow
+        """
+        name = screen_name.lower()
+        with self._lock:
+            action = self._pending_follows.get(name)
+            if action is not None:
+                return action == ActionType.FOLLOW.value
+            row = self._conn.execute(
+                'SELECT action FROM actions WHERE screen_name = ? AND action IN (?, ?) '
+                'AND dry_run = ? ORDER BY ts DESC LIMIT 1',
+                (name, ActionType.FOLLOW.value, ActionType.UNFOLLOW.value,
+                 self._dry_run)).fetchone()
+        return row is not None and row[0] == ActionType.FOLLOW.value
+
+    def follow_times(self) -> Dict[str, float]:
+        """
+        Follow timestamp of every user still followed
+        """
+        return {name: ts for name, (action, ts) in self._last_follows().items()
+                if action == ActionType.FOLLOW.value}
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def init_db(db_file: str, dry_run: bool = False) -> Ledger:
+    """
+    Open (and create if needed) the action ledger
+    """
+    ledger = Ledger(db_file, dry_run)
+    logger.info(f'Action ledger ready at {db_file}.')
+    return ledger
@@ -0,0 +1,197 @@
+"""
+Engagement pipeline: search, filter and action stages connected by bounded queues.
+
+Each stage runs on its own thread, so a slow retweet never holds back the next
+search. Queues are bounded, a stage blocks when the next one falls behind.
+"""
+import logging
+import time
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, List, Optional
+
+from twisper.profiling import profiler
+from twisper.scheduler import EpochPacer
+
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream on a queue, so stages drain before exiting
+_DONE = object()
+
+# Tweets taken off the action queue at once, their follow candidates are looked up together
+FRIENDSHIP_BATCH_SIZE = 20
+
+
+class EngagePipeline:
+    """
+    search producer -> filter stage -> action stage -> Scheduler (one queue per action type)
+    """
+
+    def __init__(self, bot: Any, queue_size: int = 1000, pacer: Optional[EpochPacer] = None) -> None:
+        """
+        :param bot: TwisperBot providing iter_search, filter_tweet and engage
+        :param queue_size: max number of tweets waiting between two stages
+        :param pacer: paces the searches, None searches again right away
+        """
+        self.bot = bot
+        self.queue_size = queue_size
+        self.pacer = pacer
+
+        self._filter_queue: Queue = Queue(maxsize=queue_size)
+        self._action_queue: Queue = Queue(maxsize=queue_size)
+        self._stop = Event()
+        self._threads: List[Thread] = []
+
+        self.epoch = 0
+        self.searched = 0
+        self.engaged = 0
+
+    @property
+    def running(self) -> bool:
+        return any(x.is_alive() for x in self._threads)
+
+    def start(self) -> None:
+        """
+        Start all stages
+        """
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._search_stage, name='twisper-search-stage', daemon=True),
+            Thread(target=self._filter_stage, name='twisper-filter-stage', daemon=True),
+            Thread(target=self._action_stage, name='twisper-action-stage', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        logger.info('Engage pipeline started.')
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop searching and let the queued tweets go through the remaining stages
+        :param timeout: max seconds to wait for the drain
+        """
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            thread.join(timeout=remaining)
+
+        if self.running:
+            logger.warning('Engage pipeline did not drain in time.')
+        else:
+            logger.info(f'Engage pipeline stopped after {self.epoch} epochs, '
+                        f'engaged with {self.engaged}/{self.searched} tweets.')
+
+    def _put(self, queue: Queue, item: Any) -> None:
+        """
+        Blocking put that still lets the stop flag through.
+        The end marker is always delivered.
+        """
+        while True:
+            try:
+                queue.put(item, timeout=0.5)
+                return
+            except Full:
+                if self._stop.is_set() and item is not _DONE:
+                    return
+
+    def _validate(self, tweets: List[Any]) -> int:
+        """
+        Validate a batch, hydrate the originals of the valid ones and hand them to the filter stage
+        :return: number of tweets in the batch
+        """
+        valid = [tweets[i] for i in self.bot.validate_tweets(tweets)]
+        self.bot.hydrate(valid)
+        for tweet in valid:
+            self._put(self._filter_queue, tweet)
+        return len(tweets)
+
+    def _search_stage(self) -> None:
+        try:
+            while not self._stop.is_set():
+                start = time.monotonic()
+                self.epoch += 1
+                searched = 0
+                try:
+                    # The search stage thread only, the other stages run on their own
+                    with profiler.epoch():
+                        for result in self.bot.iter_search():
+                            searched += self._validate(self.bot.filter_seen(result.tweets))
+                        searched += self._validate(self.bot.filter_seen(self.bot.recheck()))
+                    self.bot.end_epoch()
+                    if self.pacer:
+                        self.pacer.success(searched)
+                except Exception as e:
+                    logger.error(f'Search stage failed: {e}')
+                    if self.pacer:
+                        self.pacer.failure()
+                self.searched += searched
+
+                if self.pacer:
+                    self._stop.wait(self.pacer.sleep_for(time.monotonic() - start))
+        finally:
+            self._put(self._filter_queue, _DONE)
+
+    def _filter_stage(self) -> None:
+        try:
+            while True:
+                tweet = self._filter_queue.get()
+                if tweet is _DONE:
+                    break
+                try:
+                    tweet = self.bot.filter_valid(tweet)
+                except Exception as e:
+                    logger.error(f'Filter stage failed: {e}')
+                    continue
+                if tweet is not None:
+                    self._put(self._action_queue, tweet)
+        finally:
+            self._put(self._action_queue, _DONE)
+
+    def _take_batch(self, first: Any, size: int) -> List[Any]:
+        """
+        first plus whatever is already waiting on the action queue, up to size items
+        """
+        batch = [first]
+        while len(batch) < size and batch[-1] is not _DONE:
+            try:
+                batch.append(self._action_queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _action_stage(self) -> None:
+        scheduler = self.bot._schedule
+        while True:
+            batch = self._take_batch(self._action_queue.get(), FRIENDSHIP_BATCH_SIZE)
+            tweets = [x for x in batch if x is not _DONE]
+
+            # One friendships/lookup request for the whole batch
+            try:
+                self.bot.prefetch_friendships(tweets)
+            except Exception as e:
+                logger.error(f'Friendship lookup failed: {e}')
+
+            for tweet in tweets:
+                # Backpressure from the per action type queues of the scheduler
+                while scheduler.pending() >= self.queue_size and not self._stop.is_set():
+                    self._stop.wait(0.5)
+
+                try:
+                    if self.bot.engage(tweet):
+                        self.engaged += 1
+                except Exception as e:
+                    logger.error(f'Action stage failed: {e}')
+
+            if len(tweets) < len(batch):
+                break
+
+    def qsize(self) -> int:
+        """
+        Tweets waiting in the pipeline queues
+        """
+        return self._filter_queue.qsize() + self._action_queue.qsize()
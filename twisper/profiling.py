@@ -0,0 +1,194 @@
+"""
+Per stage timing histograms and an optional cProfile dump every N epochs.
+
+Nothing is wrapped unless profiling is enabled: instrument() replaces methods on
+the given instances only, so a disabled profiler costs nothing on the hot path.
+"""
+import cProfile
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+
+logger = logging.getLogger(__name__)
+
+
+class HdrHistogram:
+    """
+    Log-linear histogram of integer values (ns): every power of two range is split
+    into 2 ** (sub_bucket_bits - 1) buckets, i.e. ~1% precision at the default 7 bits.
+    Recording is a couple of integer ops and a dict update, under a lock as the pipeline
+    and scheduler threads record concurrently.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7) -> None:
+        self._bits = sub_bucket_bits
+        self._mask = (1 << sub_bucket_bits) - 1
+        self._counts: Dict[int, int] = {}
+        self._lock = Lock()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self._bits
+        if shift <= 0:
+            return value
+        return (shift << self._bits) | (value >> shift)
+
+    def _value(self, index: int) -> int:
+        shift = index >> self._bits
+        if shift == 0:
+            return index
+        sub = index & self._mask
+        # Middle of the bucket
+        return (sub << shift) + (1 << (shift - 1))
+
+    def record(self, value: int) -> None:
+        value = max(int(value), 0)
+        index = self._index(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, pct: float) -> int:
+        with self._lock:
+            if not self.count:
+                return 0
+            target = max(self.count * pct / 100, 1)
+            seen = 0
+            for index in sorted(self._counts):
+                seen += self._counts[index]
+                if seen >= target:
+                    return min(self._value(index), self.max)
+            return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self.count = self.total = self.max = 0
+
+
+class Profiler:
+    """
+    Collects a HdrHistogram of durations per stage
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.histograms: Dict[str, HdrHistogram] = {}
+        self.cprofile_every = 0
+        self.cprofile_dir = '.'
+        self.epochs = 0
+
+    def configure(self, enabled: bool, cprofile_every: int = 0,
+                  cprofile_dir: str = '.') -> None:
+        """
+        :param enabled: time the instrumented stages
+        :param cprofile_every: run cProfile on every Nth epoch, 0 disables
+        :param cprofile_dir: where to write the .prof dumps
+        """
+        self.enabled = enabled
+        self.cprofile_every = cprofile_every
+        self.cprofile_dir = cprofile_dir
+
+    def histogram(self, stage: str) -> HdrHistogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, HdrHistogram())
+        return histogram
+
+    def record(self, stage: str, duration_ns: int) -> None:
+        self.histogram(stage).record(duration_ns)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a block: with profiler.stage('search'): ...
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter_ns() - start)
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """
+        Wrap func so every call is recorded under name
+        """
+        histogram = self.histogram(name)
+        clock = time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.record(clock() - start)
+
+        return wrapper
+
+    def instrument(self, obj: Any, methods: Iterable[str], prefix: str = '') -> None:
+        """
+        Replace the given methods of obj by timed ones, no-op when disabled
+        """
+        if not self.enabled:
+            return
+        for name in methods:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self.timed(prefix + name, method))
+
+    @contextmanager
+    def epoch(self) -> Iterator[None]:
+        """
+        Surrounds one epoch, every cprofile_every-th epoch runs under cProfile
+        (current thread only) and is dumped to cprofile_dir.
+        """
+        self.epochs += 1
+        if not self.cprofile_every or self.epochs % self.cprofile_every:
+            with self.stage('epoch'):
+                yield
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            with self.stage('epoch'):
+                yield
+        finally:
+            profile.disable()
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            path = os.path.join(self.cprofile_dir, f'epoch-{self.epochs}.prof')
+            profile.dump_stats(path)
+            logger.info(f'Wrote profile of epoch {self.epochs} to {path}')
+
+    def summary(self) -> str:
+        """
+        One line per stage: count, mean and percentiles in microseconds
+        """
+        lines: List[str] = []
+        for stage, h in sorted(self.histograms.items()):
+            if not h.count:
+                continue
+            lines.append(f'{stage}: n={h.count} mean={h.mean() / 1e3:.1f}us '
+                         f'p50={h.percentile(50) / 1e3:.1f}us p99={h.percentile(99) / 1e3:.1f}us '
+                         f'max={h.max / 1e3:.1f}us')
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
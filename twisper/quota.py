@@ -0,0 +1,137 @@
+"""
+Rate limit accounting per endpoint and classification of API errors.
+"""
+import logging
+import re
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from twisper.enums import ErrorKind
+from twisper.metrics import MetricsRegistry, registry as default_registry
+
+
+logger = logging.getLogger(__name__)
+
+# Twitter error codes meaning the action was done before
+ALREADY_DONE_CODES = {139, 160, 327, 349}
+# Status update / follow limits, spam and automation flags
+LIMIT_CODES = {88, 161, 185, 205, 226}
+
+_ids = re.compile(r'/\d+(?=[/.]|$)')
+_version = re.compile(r'^/(?:1\.1|2)/')
+
+
+def endpoint_name(url: str) -> str:
+    """
+    "https://api.twitter.com/1.1/statuses/retweet/123.json" -> "statuses/retweet/:id"
+    """
+    path = url.split('://', 1)[-1]
+    path = path[path.find('/'):].split('?', 1)[0]
+    path = _version.sub('/', path)
+    path = _ids.sub('/:id', path).lstrip('/')
+    return path[:-5] if path.endswith('.json') else path
+
+
+def classify_error(error: Exception) -> ErrorKind:
+    """
+    Tell "already retweeted" from rate limits, forbidden actions and transient failures
+    """
+    codes = set(getattr(error, 'api_codes', None) or [])
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    message = str(error).lower()
+
+    if codes & ALREADY_DONE_CODES or 'already' in message:
+        return ErrorKind.ALREADY_DONE
+    if status == 429 or codes & LIMIT_CODES:
+        return ErrorKind.RATE_LIMITED
+    if status in (401, 403, 404):
+        return ErrorKind.FORBIDDEN
+    if status is None and any(x in type(error).__name__ for x in ('Connection', 'Timeout')) \
+            or status is not None and status >= 500:
+        return ErrorKind.TRANSIENT
+    return ErrorKind.OTHER
+
+
+class QuotaTracker:
+    """
+    Remaining calls and reset time per endpoint, read from the x-rate-limit-* headers
+    of every response, plus request / error counters in the metrics registry.
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None) -> None:
+        metrics = metrics or default_registry
+        self._quota: Dict[str, Tuple[int, int, float]] = {}
+        self._lock = Lock()
+
+        self.requests = metrics.counter('twisper_api_requests_total',
+                                        'API responses by endpoint and status',
+                                        ['endpoint', 'status'])
+        self.errors = metrics.counter('twisper_api_errors_total',
+                                      'Failed API actions by endpoint and kind',
+                                      ['endpoint', 'kind'])
+        self.remaining = metrics.gauge('twisper_rate_limit_remaining',
+                                       'Calls left in the current rate limit window',
+                                       ['endpoint'])
+        self.limit = metrics.gauge('twisper_rate_limit_limit',
+                                   'Calls allowed per rate limit window', ['endpoint'])
+        self.reset = metrics.gauge('twisper_rate_limit_reset_timestamp',
+                                   'Unix time the rate limit window resets', ['endpoint'])
+        self.latency = metrics.histogram('twisper_api_latency_seconds',
+                                         'API response time by endpoint', ['endpoint'])
+
+    def hook(self, response, *args, **kwargs):
+        """
+        requests response hook, install with session.hooks['response'].append(tracker.hook)
+        """
+        endpoint = endpoint_name(response.url)
+        self.requests.inc(endpoint, str(response.status_code))
+        self.latency.observe(endpoint, value=response.elapsed.total_seconds())
+
+        headers = response.headers
+        if 'x-rate-limit-remaining' in headers:
+            try:
+                limit = int(headers.get('x-rate-limit-limit', 0))
+                remaining = int(headers['x-rate-limit-remaining'])
+                reset = float(headers.get('x-rate-limit-reset', 0))
+            except ValueError:
+                return response
+            with self._lock:
+                self._quota[endpoint] = (limit, remaining, reset)
+            self.limit.set(endpoint, value=limit)
+            self.remaining.set(endpoint, value=remaining)
+            self.reset.set(endpoint, value=reset)
+
+        return response
+
+    def record_error(self, endpoint: str, error: Exception) -> ErrorKind:
+        """
+        Count a failed action
+        :return: the error kind
+        """
+        kind = classify_error(error)
+        self.errors.inc(endpoint, kind.value)
+        if kind == ErrorKind.ALREADY_DONE:
+            logger.debug(f'{endpoint}: {error}')
+        else:
+            logger.warning(f'{endpoint} failed ({kind}): {error}')
+        return kind
+
+    def get(self, endpoint: str) -> Optional[Tuple[int, int, float]]:
+        """
+        :return: (limit, remaining, reset timestamp) or None if unknown
+        """
+        return self._quota.get(endpoint)
+
+    def summary(self) -> str:
+        """
+        One line overview for the heartbeat
+        """
+        now = time.time()
+        with self._lock:
+            items = sorted(self._quota.items())
+        parts = [f'{k} {rem}/{lim} (reset in {max(reset - now, 0):.0f}s)'
+                 for k, (lim, rem, reset) in items]
+        errors = {f'{k[0]}:{k[1]}': int(v) for k, v in self.errors.values().items()}
+        return f"quota: {', '.join(parts) or 'n/a'}; errors: {errors or 'none'}"
@@ -0,0 +1,54 @@
+"""
+Ranks engagement candidates, so rate limited actions go to the most valuable giveaways first.
+"""
+import math
+from typing import List, Sequence
+
+from twisper.config import Config
+from twisper.matcher import KeywordMatcher, TweetMatch
+
+
+class Ranker:
+    """
+    Scores a tweet by the log of its retweets and its author's followers, plus a bonus
+    per action it asks for, decayed by half every half_life hours of age.
+
+    The decay is applied to the creation time (newer tweets score higher), not to the age
+    at scoring time, so a score never changes and can serve as a fixed priority.
+    Scores are only meaningful relative to each other.
+    """
+
+    def __init__(self, retweets: float = 1.0, followers: float = 0.5, tags: float = 1.0,
+                 half_life: float = 24.0) -> None:
+        """
+        :param retweets: weight of log(1 + retweet count)
+        :param followers: weight of log(1 + author followers)
+        :param tags: bonus per matched action type (retweet, follow, like, message)
+        :param half_life: hours after which a tweet is worth half as much
+        """
+        self.retweets = retweets
+        self.followers = followers
+        self.tags = tags
+        self.decay = math.log(2) / (max(half_life, 1e-3) * 3600)
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'Ranker':
+        return cls(retweets=config.PRIORITY_RETWEETS, followers=config.PRIORITY_FOLLOWERS,
+                   tags=config.PRIORITY_TAGS, half_life=config.PRIORITY_HALF_LIFE)
+
+    def score(self, tweet, match: TweetMatch) -> float:
+        """
+        :param tweet: TweetRecord
+        :param match: keywords matched in the tweet text
+        """
+        actions = bool(match.rt) + bool(match.follow) + bool(match.like) + bool(match.msg)
+
+        return (self.retweets * math.log1p(tweet.retweet_count) +
+                self.followers * math.log1p(getattr(tweet.user, 'followers_count', 0)) +
+                self.tags * actions + self.decay * tweet.created_at.timestamp())
+
+    def rank(self, tweets: Sequence, matcher: KeywordMatcher) -> List:
+        """
+        Tweets sorted best first
+        """
+        return sorted(tweets, key=lambda x: self.score(x, matcher.match(x.text)), reverse=True)
@@ -0,0 +1,348 @@
+"""
+Rate limit aware action scheduler.
+
+Actions (retweets, follows, likes, DMs) are queued per TimerType and dispatched
+from a background thread as soon as the matching token bucket has budget, so
+searching and filtering never wait on the action rate limits. Budget always goes
+to the highest priority action queued, actions past their deadline are dropped.
+"""
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from twisper.config import Config
+from twisper.enums import TimerType
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `limit` actions per `window` seconds, with bursts of up to `burst`
+    """
+
+    def __init__(self, limit: float, window: float, burst: float = 1) -> None:
+        self.rate = limit / window
+        self.capacity = max(burst, 1)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """
+        Take a token if one is available
+        """
+        self._refill(time.monotonic() if now is None else now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """
+        Seconds until the next token is available
+        """
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def inherit(self, other: 'TokenBucket') -> None:
+        """
+        Continue from the tokens left in other (the bucket this one replaces)
+        """
+        now = time.monotonic()
+        other._refill(now)
+        self._tokens = min(other._tokens, self.capacity)
+        self._last = now
+
+
+def buckets_from_config(config: Config) -> Dict[TimerType, TokenBucket]:
+    """
+    Build one bucket per action type.
+    Entries in `rate_limits` win, otherwise the legacy timers are used as the refill interval.
+    """
+    timers = {
+        TimerType.RETWEET: config.TIMER_RT,
+        TimerType.FOLLOW: config.TIMER_FOLLOW,
+        TimerType.MESSAGE: config.TIMER_MSG,
+        TimerType.LIKE: config.TIMER_RT,
+        TimerType.UNFOLLOW: config.TIMER_FOLLOW,
+    }
+
+    buckets = {}
+    for timer_type, timer in timers.items():
+        limit = config.RATE_LIMITS.get(timer_type.value)
+        if limit:
+            buckets[timer_type] = TokenBucket(limit['limit'], limit['window'],
+                                              limit.get('burst', 1))
+        else:
+            buckets[timer_type] = TokenBucket(1, max(timer, 1))
+
+    return buckets
+
+
+# (-priority, sequence, deadline, future, func, args, kwargs), heapq keeps the best first
+Action = Tuple[float, int, Optional[float], Future, Callable, tuple, dict]
+
+
+class Scheduler:
+    """
+    Queues actions per TimerType and runs them when their bucket has budget.
+    Highest priority first, submission order among equal priorities.
+    """
+
+    def __init__(self, buckets: Dict[TimerType, TokenBucket]) -> None:
+        self._buckets = buckets
+        self._queues: Dict[TimerType, List[Action]] = {x: [] for x in buckets}
+        self._sequence = itertools.count()
+        self._cond = Condition()
+        self._running = False
+        # Set by stop(), submit() then refuses new actions until start() is called again
+        self._stopped = False
+        self._busy = False
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        """
+        Start the dispatcher thread
+        """
+        with self._cond:
+            self._stopped = False
+            if self._running:
+                return
+            self._running = True
+
+        self._spawn()
+
+    def _spawn(self) -> None:
+        self._thread = Thread(target=self._dispatch, name='twisper-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, timer_type: TimerType, func: Callable, *args: Any, priority: float = 0,
+               deadline: Optional[float] = None, **kwargs: Any) -> Future:
+        """
+        Queue an action
+        :param timer_type: which rate limit the action counts against
+        :param func: callable doing the API call
+        :param priority: higher runs first
+        :param deadline: epoch seconds after which the action is dropped (future cancelled)
+        :return: Future resolved with the result of func
+        :raises RuntimeError: once the scheduler was stopped
+        """
+        future: Future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('Cannot submit actions to a stopped scheduler')
+            heapq.heappush(self._queues[timer_type],
+                           (-priority, next(self._sequence), deadline, future, func, args, kwargs))
+            self._cond.notify_all()
+            # First action, start dispatching
+            spawn = not self._running
+            self._running = True
+
+        if spawn:
+            self._spawn()
+
+        return future
+
+    def set_buckets(self, buckets: Dict[TimerType, TokenBucket]) -> None:
+        """
+        Swap in new rate limits, spent budget carries over and queued actions are kept
+        """
+        with self._cond:
+            for timer_type, bucket in buckets.items():
+                if timer_type in self._buckets:
+                    bucket.inherit(self._buckets[timer_type])
+                self._queues.setdefault(timer_type, [])
+            self._buckets = buckets
+            self._cond.notify_all()
+
+    def pending(self, timer_type: Optional[TimerType] = None) -> int:
+        """
+        Number of queued actions, for one type or overall
+        """
+        with self._cond:
+            if timer_type is not None:
+                return len(self._queues[timer_type])
+            return sum(len(x) for x in self._queues.values())
+
+    def has_budget(self, timer_type: TimerType) -> bool:
+        """
+        Check if an action of this type could run right now
+        """
+        with self._cond:
+            return not self._queues[timer_type] and \
+                self._buckets[timer_type].wait_time() == 0
+
+    def _expire(self, queue: List[Action], now: float) -> None:
+        """
+        Drop expired actions from the head of the queue, the others go once they reach it
+        """
+        while queue and queue[0][2] is not None and queue[0][2] < now:
+            action = heapq.heappop(queue)
+            action[3].cancel()
+            logger.debug(f'Dropped stale action {action[4].__name__}{action[5]}.')
+
+    def _next(self) -> Tuple[Optional[Action], float]:
+        """
+        Pop the highest priority action among the types with budget.
+        :return: (action or None, seconds to wait before anything can run)
+        """
+        wait = None
+        best: Optional[TimerType] = None
+        now = time.monotonic()
+        wall = time.time()
+        for timer_type, queue in self._queues.items():
+            self._expire(queue, wall)
+            if not queue:
+                continue
+            bucket = self._buckets[timer_type]
+            bucket_wait = bucket.wait_time(now)
+            if bucket_wait == 0:
+                if best is None or queue[0] < self._queues[best][0]:
+                    best = timer_type
+            else:
+                wait = bucket_wait if wait is None else min(wait, bucket_wait)
+
+        if best is not None and self._buckets[best].try_acquire(now):
+            return heapq.heappop(self._queues[best]), 0.0
+
+        return None, wait if wait is not None else -1.0
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while True:
+                    if not self._running:
+                        return
+                    action, wait = self._next()
+                    if action is not None:
+                        break
+                    self._cond.wait(timeout=None if wait < 0 else wait)
+                self._busy = True
+
+            future, func, args, kwargs = action[3:]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                logger.error(f'Scheduled action failed: {e}')
+                future.set_exception(e)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued actions ran
+        :return: False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._busy or any(self._queues.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop dispatching, queued actions are cancelled and new ones rejected
+        """
+        with self._cond:
+            self._running = False
+            self._stopped = True
+            for queue in self._queues.values():
+                for action in queue:
+                    action[3].cancel()
+                queue.clear()
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class EpochPacer:
+    """
+    Adapts the time between two searches to how many new tweets they bring in.
+
+    Many new tweets shorten the interval, few lengthen it, always within
+    [min_interval, max_interval]. The actual epoch duration is subtracted from
+    the sleep. Errors switch to a jittered exponential backoff until an epoch succeeds.
+    """
+
+    def __init__(self, interval: float, min_interval: float, max_interval: float,
+                 target_new: int = 50, error_backoff: float = 30,
+                 max_error_backoff: float = 1800) -> None:
+        """
+        :param interval: starting interval (seconds)
+        :param min_interval: shortest interval, keeps the search quota in check
+        :param max_interval: longest interval
+        :param target_new: new tweets per epoch at which the interval stays the same
+        :param error_backoff: first backoff after an error (seconds)
+        :param max_error_backoff: longest backoff after errors
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.target_new = max(target_new, 1)
+        self.error_backoff = error_backoff
+        self.max_error_backoff = max_error_backoff
+        self.errors = 0
+
+    def success(self, new_tweets: int) -> None:
+        """
+        Adjust the interval after an epoch that found new_tweets tweets
+        """
+        self.errors = 0
+        # Twice the target halves the interval, nothing new doubles it
+        ratio = min(max(new_tweets / self.target_new, 0.5), 2.0)
+        self.interval = min(max(self.interval / ratio, self.min_interval), self.max_interval)
+
+    def failure(self) -> None:
+        self.errors += 1
+
+    def update(self, other: 'EpochPacer') -> None:
+        """
+        Take the limits of other (built from a reloaded config), keeping the current interval and errors
+        """
+        self.min_interval = other.min_interval
+        self.max_interval = other.max_interval
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+        self.target_new = other.target_new
+        self.error_backoff = other.error_backoff
+        self.max_error_backoff = other.max_error_backoff
+
+    def sleep_for(self, epoch_duration: float) -> float:
+        """
+        Seconds to sleep before the next epoch
+        :param epoch_duration: how long the last epoch took
+        """
+        if self.errors:
+            cap = min(self.error_backoff * 2 ** (self.errors - 1), self.max_error_backoff)
+            return random.uniform(cap / 2, cap)
+
+        return max(self.interval - epoch_duration, 0.0)
+
+
+def pacer_from_config(config: Config, tags: Optional[int] = None) -> EpochPacer:
+    """
+    :param tags: tags searched per epoch, defaults to the config's TAGS_SEARCH
+    """
+    # Search allows 180 requests per 15 minutes, i.e. one every 5 seconds
+    quota_interval = 5 * (tags or len(config.TAGS_SEARCH)) * config.SEARCH_MAX_PAGES
+    return EpochPacer(config.TIMER_SLEEP,
+                      min_interval=config.MIN_SLEEP or quota_interval,
+                      max_interval=config.MAX_SLEEP or max(10 * config.TIMER_SLEEP, 600),
+                      target_new=config.TARGET_NEW_TWEETS,
+                      error_backoff=config.ERROR_BACKOFF)
@@ -0,0 +1,149 @@
+"""
+Search fan-out: runs the per-tag searches concurrently on a bounded thread pool.
+"""
+import json
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchResult(NamedTuple):
+    """
+    Outcome of the search for a single tag.
+    Errors are kept per tag so one failing query doesn't lose the others.
+    """
+    tag: str
+    tweets: List[Any]
+    error: Optional[Exception] = None
+
+
+class SearchFanOut:
+    """
+    Runs one search per tag on a bounded thread pool and yields results as they arrive
+    """
+
+    def __init__(self, search_func: Callable[[str], List[Any]], max_workers: int = 1) -> None:
+        """
+        :param search_func: callable running the search for one tag
+        :param max_workers: concurrency cap, 1 runs the searches serially in the caller thread
+        """
+        self._search_func = search_func
+        self._max_workers = max(int(max_workers), 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Searches of the current epoch, cancelled on shutdown
+        self._futures: List[Future] = []
+
+        if self._max_workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix='twisper-search')
+
+    def _run(self, tag: str) -> SearchResult:
+        try:
+            return SearchResult(tag, list(self._search_func(tag)))
+        except Exception as e:
+            logger.warning(f'Search for "{tag}" failed: {e}')
+            return SearchResult(tag, [], e)
+
+    def search(self, tags: Iterable[str]) -> Iterator[SearchResult]:
+        """
+        Search all tags
+        :param tags: queries to run
+        :return: iterator of SearchResult, in completion order
+        """
+        if self._executor is None:
+            for tag in tags:
+                yield self._run(tag)
+            return
+
+        futures = [self._executor.submit(self._run, tag) for tag in tags]
+        self._futures = futures
+        for future in as_completed(futures):
+            yield future.result()
+
+    def shutdown(self) -> None:
+        """
+        Stop the pool, pending searches are cancelled
+        """
+        if self._executor is not None:
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class Watermarks:
+    """
+    Highest tweet id seen per query, so the next search only asks for newer tweets.
+
+    A search cut short by max_pages leaves a gap between the watermark and the oldest
+    tweet fetched. The watermark then stays put and the next search resumes below that
+    tweet (max_id), it only moves once paging reached it.
+    Persisted as a json dict {query: since_id}, or {query: [since_id, max_id, newest]}
+    while a gap is being filled.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._since_ids: Dict[str, int] = {}
+        # Query -> (max_id to resume paging from, newest id of the interrupted search)
+        self._resume: Dict[str, Tuple[int, int]] = {}
+        self._lock = Lock()
+
+        if self._path and os.path.exists(self._path):
+            try:
+                with open(self._path, 'r') as file:
+                    for k, v in json.load(file).items():
+                        if isinstance(v, list):
+                            self._since_ids[k] = int(v[0])
+                            self._resume[k] = (int(v[1]), int(v[2]))
+                        else:
+                            self._since_ids[k] = int(v)
+            except (ValueError, AttributeError, IndexError, TypeError) as e:
+                logger.warning(f'Ignoring broken watermark file {self._path}: {e}')
+
+    def get(self, query: str) -> Optional[int]:
+        return self._since_ids.get(query)
+
+    def resume(self, query: str) -> Optional[int]:
+        """
+        max_id to continue an interrupted search of query from, None to start from the newest
+        """
+        resume = self._resume.get(query)
+        return resume[0] if resume else None
+
+    def update(self, query: str, tweets: List[Any], next_max_id: Optional[int] = None) -> None:
+        """
+        Move the watermark of query to the newest tweet seen, once paging reached the watermark
+        :param tweets: tweets returned by the search
+        :param next_max_id: where paging stopped when max_pages cut it short, None if complete
+        """
+        newest = max((x.id for x in tweets), default=0)
+        with self._lock:
+            resume = self._resume.pop(query, None)
+            newest = max(newest, resume[1] if resume else 0)
+
+            # The first search of a query has no gap to fill
+            if next_max_id is not None and query in self._since_ids:
+                self._resume[query] = (next_max_id, newest)
+            elif newest > self._since_ids.get(query, 0):
+                self._since_ids[query] = newest
+
+    def save(self) -> None:
+        if not self._path:
+            return
+
+        with self._lock:
+            data: Dict[str, Any] = dict(self._since_ids)
+            for query, (max_id, newest) in self._resume.items():
+                data[query] = [self._since_ids[query], max_id, newest]
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self._path)
@@ -0,0 +1,120 @@
+"""
+Index of tweet ids the bot already handled, shared across tags and epochs.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class SeenIndex:
+    """
+    Bounded LRU of tweet ids with a time to live.
+
+    Ids older than `ttl` seconds are forgotten, the least recently seen ids are
+    dropped once `max_size` is reached. The index is persisted as one
+    "<id> <timestamp>" line per tweet so warm starts skip work already done.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 100000,
+                 ttl: float = 7 * 24 * 3600) -> None:
+        """
+        :param path: file to load from and save to, None keeps the index in memory only
+        :param max_size: max number of ids kept
+        :param ttl: seconds an id is remembered
+        """
+        self._path = path
+        self._max_size = max_size
+        self._ttl = ttl
+        self._ids: 'OrderedDict[int, float]' = OrderedDict()
+        self._lock = Lock()
+
+        if self._path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, tweet_id) -> bool:
+        seen_at = self._ids.get(int(tweet_id))
+        return seen_at is not None and time.time() - seen_at <= self._ttl
+
+    def add(self, tweet_id) -> bool:
+        """
+        Mark a tweet id as seen
+        :return: True if the id was not seen before
+        """
+        tweet_id = int(tweet_id)
+        with self._lock:
+            new = tweet_id not in self
+            self._ids[tweet_id] = time.time()
+            self._ids.move_to_end(tweet_id)
+            while len(self._ids) > self._max_size:
+                self._ids.popitem(last=False)
+        return new
+
+    def discard(self, tweet_id) -> None:
+        """
+        Forget a tweet id, it counts as new the next time it is added
+        """
+        with self._lock:
+            self._ids.pop(int(tweet_id), None)
+
+    def update(self, tweet_ids: Iterable) -> None:
+        for tweet_id in tweet_ids:
+            self.add(tweet_id)
+
+    def _expire(self) -> None:
+        limit = time.time() - self._ttl
+        while self._ids:
+            tweet_id, seen_at = next(iter(self._ids.items()))
+            if seen_at >= limit:
+                break
+            del self._ids[tweet_id]
+
+    def load(self) -> None:
+        """
+        Load the index from disk, missing or broken lines are ignored
+        """
+        if not self._path or not os.path.exists(self._path):
+            return
+
+        entries = []
+        with open(self._path, 'r') as file:
+            for line in file:
+                try:
+                    tweet_id, seen_at = line.split()
+                    entries.append((float(seen_at), int(tweet_id)))
+                except ValueError:
+                    continue
+
+        with self._lock:
+            for seen_at, tweet_id in sorted(entries):
+                self._ids[tweet_id] = seen_at
+                self._ids.move_to_end(tweet_id)
+            self._expire()
+            while len(self._ids) > self._max_size:
+                self._ids.popitem(last=False)
+
+        logger.info(f'Loaded {len(self._ids)} seen tweets from {self._path}.')
+
+    def save(self) -> None:
+        """
+        Write the index to disk, atomically replacing the previous file
+        """
+        if not self._path:
+            return
+
+        with self._lock:
+            self._expire()
+            lines = [f'{tweet_id} {seen_at:.0f}\n' for tweet_id, seen_at in self._ids.items()]
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.writelines(lines)
+        os.replace(tmp_path, self._path)
@@ -0,0 +1,118 @@
+"""
+Tuned HTTP session for the Twitter API: sized connection pool, keep-alive,
+per endpoint timeouts and retries that follow Twitter's rate limit headers.
+"""
+import logging
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Not idempotent: a 5xx or read error may come after Twitter applied the request
+# (a DM sent twice), these are only retried when rejected by the rate limit or never sent
+REJECTED_ONLY_METHODS = frozenset(['POST'])
+
+Timeout = Tuple[float, float]
+
+
+class RateLimitRetry(Retry):
+    """
+    Retry that waits for `x-rate-limit-reset` when there is no Retry-After header,
+    never longer than `max_wait` seconds.
+    """
+
+    def __init__(self, *args, max_wait: float = 60, **kwargs) -> None:
+        self.max_wait = max_wait
+        super().__init__(*args, **kwargs)
+
+    def new(self, **kwargs) -> 'RateLimitRetry':
+        kwargs.setdefault('max_wait', self.max_wait)
+        return super().new(**kwargs)  # type: ignore[return-value]
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method and method.upper() in REJECTED_ONLY_METHODS:
+            return status_code == 429
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            reset = response.headers.get('x-rate-limit-reset')
+            if reset and response.status == 429:
+                try:
+                    retry_after = max(float(reset) - time.time(), 0)
+                except ValueError:
+                    return None
+        if retry_after is not None:
+            logger.info(f'Rate limited, retrying in {min(retry_after, self.max_wait):.0f} s.')
+            return min(retry_after, self.max_wait)
+        return None
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """
+    HTTPAdapter picking the timeout by endpoint (longest matching path fragment)
+    """
+
+    def __init__(self, timeouts: Dict[str, Timeout], default: Timeout, **kwargs) -> None:
+        self.timeouts = sorted(timeouts.items(), key=lambda x: len(x[0]), reverse=True)
+        self.default = default
+        super().__init__(**kwargs)
+
+    def timeout_for(self, url: str) -> Timeout:
+        return next((v for k, v in self.timeouts if k in url), self.default)
+
+    def send(self, request, **kwargs):
+        kwargs['timeout'] = self.timeout_for(request.url)
+        return super().send(request, **kwargs)
+
+
+class KeepAliveSession(requests.Session):
+    """
+    Session keeping its pool on close(): tweepy.API closes its session after every request,
+    which would drop the keep-alive connections. shutdown() really closes it.
+    """
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+def create_session(pool_size: int = 10, retries: int = 3, backoff_factor: float = 1.0,
+                   max_retry_wait: float = 60,
+                   timeouts: Optional[Dict[str, Sequence[float]]] = None,
+                   default_timeout: Sequence[float] = (5, 30)) -> KeepAliveSession:
+    """
+    Session shared by all search and action threads
+    :param pool_size: connections kept alive per host, at least the number of concurrent workers
+    :param retries: retries on 429 / 5xx and connection errors, POST only on 429 and connect errors
+    :param backoff_factor: exponential backoff base between retries (seconds)
+    :param max_retry_wait: longest wait for a rate limit reset before retrying
+    :param timeouts: (connect, read) timeouts per endpoint path fragment, e.g. "search/tweets"
+    :param default_timeout: (connect, read) timeout for the other endpoints
+    """
+    retry = RateLimitRetry(total=retries, backoff_factor=backoff_factor,
+                           status_forcelist=RETRY_STATUSES,
+                           allowed_methods=frozenset(['GET', 'DELETE']),
+                           respect_retry_after_header=True, raise_on_status=False,
+                           max_wait=max_retry_wait)
+    adapter = TimeoutAdapter({k: tuple(v) for k, v in (timeouts or {}).items()},  # type: ignore
+                             tuple(default_timeout),  # type: ignore[arg-type]
+                             pool_connections=pool_size, pool_maxsize=pool_size,
+                             max_retries=retry)
+
+    session = KeepAliveSession()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+
+    return session
@@ -0,0 +1,172 @@
+"""
+Streaming ingestion: subscribes to the filtered stream built from TAGS_SEARCH and
+pushes every tweet into the validation and engage path.
+
+Tweets are handed from the reading thread to a single handler thread through a
+bounded queue, so API calls made while handling a tweet never stall the connection.
+"""
+import logging
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import Any, Callable, Optional
+
+import requests
+from requests_oauthlib import OAuth1
+
+from twisper.config import Config
+from twisper.records import loads
+
+
+logger = logging.getLogger(__name__)
+
+# Reconnect delays (seconds), following Twitter's streaming guidelines
+BACKOFF_NETWORK = (0.25, 16)
+BACKOFF_HTTP = (5, 320)
+BACKOFF_RATE_LIMIT = (60, 960)
+
+# Ends the handler thread
+_DONE = object()
+
+
+class TweetStream:
+    """
+    Reads the filtered stream on a background thread and reconnects with backoff,
+    another thread calls on_tweet for every tweet, one at a time
+    """
+
+    def __init__(self, config: Config, on_tweet: Callable[[Any], Any],
+                 url: Optional[str] = None, queue_size: int = 1000) -> None:
+        """
+        :param config: bot config, for credentials and TAGS_SEARCH
+        :param on_tweet: called with the decoded json of every tweet, or whatever put() got
+        :param url: stream endpoint, a local server can stand in for Twitter
+        :param queue_size: tweets waiting for on_tweet, newer ones are dropped when full
+        """
+        self._config = config
+        self._on_tweet = on_tweet
+        self._url = url or config.STREAM_URL
+        self._auth = OAuth1(config.API_KEY, config.API_KEY_SECRET,
+                            config.ACCESS_TOKEN, config.ACCESS_TOKEN_SECRET)
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._handler: Optional[Thread] = None
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._response: Optional[requests.Response] = None
+
+        self.received = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._handler = Thread(target=self._handle, name='twisper-stream-handler', daemon=True)
+        self._handler.start()
+        self._thread = Thread(target=self._run, name='twisper-stream', daemon=True)
+        self._thread.start()
+        logger.info(f'Streaming tweets for {self._config.TAGS_SEARCH}.')
+
+    def stop(self, timeout: Optional[float] = 5) -> None:
+        self._stop.set()
+        if self._response is not None:
+            self._response.close()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self._handler is not None:
+            # Tweets already queued are handled first
+            self._queue.put(_DONE)
+            self._handler.join(timeout=timeout)
+            self._handler = None
+
+    def put(self, data: Any) -> bool:
+        """
+        Queue a tweet for on_tweet, e.g. one looked up again, dropped if the queue is full
+        :return: False if dropped
+        """
+        try:
+            self._queue.put_nowait(data)
+            return True
+        except Full:
+            self.dropped += 1
+            logger.warning(f'Stream handler is behind, dropped a tweet ({self.dropped} so far).')
+            return False
+
+    def _handle(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is _DONE:
+                return
+            try:
+                self._on_tweet(data)
+            except Exception as e:
+                tweet_id = data.get('id') if isinstance(data, dict) else getattr(data, 'id', None)
+                logger.error(f'Failed to handle streamed tweet {tweet_id}: {e}')
+
+    def update_config(self, config: Config) -> None:
+        """
+        Use a reloaded config, reconnects if the tracked tags changed
+        """
+        reconnect = config.TAGS_SEARCH != self._config.TAGS_SEARCH
+        self._config = config
+        if reconnect and self._response is not None:
+            logger.info(f'Tracked tags changed, reconnecting for {config.TAGS_SEARCH}.')
+            self._response.close()
+
+    def _run(self) -> None:
+        delay = 0.0
+        while not self._stop.is_set():
+            backoff = BACKOFF_NETWORK
+            try:
+                received = self.received
+                self._connect()
+                # Clean end of stream, reconnect right away if we got anything
+                backoff = BACKOFF_NETWORK if self.received > received else BACKOFF_HTTP
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else 0
+                backoff = BACKOFF_RATE_LIMIT if status in (420, 429) else BACKOFF_HTTP
+                logger.warning(f'Stream rejected the connection ({status}).')
+            except (requests.RequestException, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f'Stream disconnected: {e}')
+
+            if self._stop.is_set():
+                break
+
+            # Start over from the minimum once a connection delivered tweets
+            if self.received > received:
+                delay = 0
+            delay = min(max(delay * 2, backoff[0]), backoff[1])
+            self.reconnects += 1
+            logger.info(f'Reconnecting stream in {delay:.2f} s.')
+            self._stop.wait(delay)
+
+    def _connect(self) -> None:
+        params = {'track': ','.join(self._config.TAGS_SEARCH), 'language': 'en'}
+        with requests.post(self._url, data=params, auth=self._auth, stream=True,
+                           timeout=(10, 90)) as response:
+            self._response = response
+            response.raise_for_status()
+
+            for line in response.iter_lines():
+                if self._stop.is_set():
+                    return
+                # Keep-alive newlines
+                if not line:
+                    continue
+
+                data = loads(line)
+                if 'id' not in data or 'text' not in data:
+                    # Limit notices, disconnect messages...
+                    logger.debug(f'Stream message: {data}')
+                    continue
+
+                self.received += 1
+                self.put(data)
@@ -0,0 +1,284 @@
+"""
+Supervisor running several accounts, one process per account.
+
+Searches are run once by the supervisor for the union of all accounts'
+TAGS_SEARCH, every result is handed to the accounts tracking that tag.
+Account processes report a heartbeat and get restarted (with backoff) when
+they die or stop reporting.
+
+> python -m twisper.supervisor account1.json account2.json
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from queue import Empty, Full
+from threading import Event, Thread
+from typing import Any, Dict, List, Optional
+
+from twisper.config import Config
+from twisper.scheduler import pacer_from_config
+from twisper.search import SearchFanOut, Watermarks
+
+
+logger = logging.getLogger(__name__)
+
+# Messages on the account queues, besides TweetRecords
+EPOCH_END = 'epoch_end'
+STOP = 'stop'
+
+RESTART_BACKOFF_MAX = 300
+
+
+def account_logfile(config: Config) -> str:
+    """
+    Accounts log to their own data_dir, unless their config names a logfile
+    """
+    if config.LOGFILE == config.log_file:
+        return os.path.join(config.data_dir, config.log_file)
+    return config.LOGFILE
+
+
+def run_account(config_file: str, queue: Any, heartbeat: Any) -> None:
+    """
+    Account process: engages with the tweets the supervisor sends
+    :param config_file: account config
+    :param queue: TweetRecords from the shared search
+    :param heartbeat: shared timestamp, updated at least once per second
+    """
+    from twisper.loggers import setup_logging_pre
+    from twisper.twisper import TwisperBot
+
+    heartbeat.value = time.time()
+    setup_logging_pre()
+    config = Config(config_file)
+    config.LOGFILE = account_logfile(config)
+    os.makedirs(config.data_dir, exist_ok=True)
+    config.set_up_logger()
+
+    # Init syncs the friends, which can take longer than the health timeout
+    ready = Event()
+
+    def beat() -> None:
+        while not ready.wait(1):
+            heartbeat.value = time.time()
+
+    Thread(target=beat, name='twisper-init-heartbeat', daemon=True).start()
+    try:
+        bot = TwisperBot(config)
+    finally:
+        ready.set()
+
+    def handle(tweet: Any) -> None:
+        try:
+            bot.handle_stream(tweet)
+        except Exception as e:
+            logger.error(f'Failed to handle tweet {tweet.id}: {e}')
+
+    try:
+        while True:
+            heartbeat.value = time.time()
+            try:
+                data = queue.get(timeout=1)
+            except Empty:
+                continue
+
+            if data == STOP:
+                break
+            if data == EPOCH_END:
+                # Deferred giveaways are not searched again
+                for tweet in bot.recheck():
+                    handle(tweet)
+                bot.end_epoch()
+                continue
+
+            handle(data)
+    finally:
+        bot._schedule.drain(timeout=config.TIMER_SLEEP)
+        bot.cleanup()
+
+
+class Account:
+    """
+    Supervisor side state of one account process
+    """
+
+    def __init__(self, ctx: Any, config: Config, queue_size: int) -> None:
+        self.ctx = ctx
+        self.config = config
+        self.queue_size = queue_size
+        self.tags = set(config.TAGS_SEARCH)
+        self.process: Optional[Any] = None
+        self.queue: Any = None
+        self.heartbeat = ctx.Value('d', 0.0)
+        self.restarts = 0
+        self.next_start = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.config.config_file
+
+    def start(self) -> None:
+        self.queue = self.ctx.Queue(maxsize=self.queue_size)
+        self.heartbeat.value = time.time()
+        self.process = self.ctx.Process(target=run_account, name=f'twisper-{self.name}',
+                                        args=(self.name, self.queue, self.heartbeat),
+                                        daemon=True)
+        self.process.start()
+        logger.info(f'Started account {self.name} (PID={self.process.pid}).')
+
+    def stop(self, timeout: float = 30) -> None:
+        if self.process is None:
+            return
+        try:
+            self.queue.put(STOP, timeout=1)
+        except Full:
+            pass
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self.process = None
+
+    def send(self, data: Any) -> bool:
+        """
+        Hand a tweet to the account, dropped if the account can't keep up
+        """
+        if self.process is None:
+            return False
+        try:
+            self.queue.put(data, timeout=0.1)
+            return True
+        except Full:
+            return False
+
+
+class Supervisor:
+    """
+    Runs one TwisperBot process per account config and a shared search
+    """
+
+    def __init__(self, config_files: List[str], queue_size: int = 10000) -> None:
+        self._ctx = multiprocessing.get_context('spawn')
+        self.accounts = [Account(self._ctx, Config(x), queue_size) for x in config_files]
+        if not self.accounts:
+            raise ValueError('No account config given.')
+
+        # Accounts sharing files would overwrite each other's state and logs
+        data_dirs = [os.path.abspath(x.config.data_dir) for x in self.accounts]
+        if len(set(data_dirs)) < len(data_dirs):
+            raise ValueError(f'Each account needs its own data_dir, got {data_dirs}.')
+        logfiles = [os.path.abspath(account_logfile(x.config)) for x in self.accounts
+                    if not account_logfile(x.config).startswith('syslog')]
+        if len(set(logfiles)) < len(logfiles):
+            raise ValueError(f'Each account needs its own logfile, got {logfiles}.')
+
+        # Searches run with the first account's credentials and settings
+        from twisper.twitter_api import T_API
+
+        self.config = self.accounts[0].config
+        self.api = T_API(self.config)
+        os.makedirs(self.config.data_dir, exist_ok=True)
+        self.watermarks = Watermarks(os.path.join(self.config.data_dir,
+                                                  'supervisor_watermarks.json'))
+        self.searcher = SearchFanOut(self._search_tag, self.config.SEARCH_WORKERS)
+
+        self.tags = list(dict.fromkeys(x for a in self.accounts for x in a.config.TAGS_SEARCH))
+        self.interval = min(x.config.TIMER_SLEEP for x in self.accounts)
+        self.health_timeout = max(60, 3 * self.interval)
+        # One search quota for all accounts, the epoch interval follows it
+        self.pacer = pacer_from_config(self.config, len(self.tags))
+        self.searched = 0
+
+    def _search_tag(self, tag: str) -> List[Any]:
+        tweets, next_max_id = self.api.search_tweets(query=tag, results=self.config.MAX_RESULTS,
+                                                     language='en',
+                                                     since_id=self.watermarks.get(tag),
+                                                     max_id=self.watermarks.resume(tag),
+                                                     max_pages=self.config.SEARCH_MAX_PAGES)
+        self.watermarks.update(tag, tweets, next_max_id)
+        return tweets
+
+    def search(self) -> Dict[str, int]:
+        """
+        One shared epoch: every tag is searched once, results go to all accounts tracking it
+        :return: tweets sent per account
+        """
+        sent = {x.name: 0 for x in self.accounts}
+        for result in self.searcher.search(self.tags):
+            self.searched += len(result.tweets)
+            accounts = [x for x in self.accounts if result.tag in x.tags]
+            for tweet in result.tweets:
+                for account in accounts:
+                    sent[account.name] += account.send(tweet)
+            self.check_health()
+
+        for account in self.accounts:
+            account.send(EPOCH_END)
+        self.watermarks.save()
+
+        return sent
+
+    def check_health(self) -> None:
+        """
+        Restart dead or unresponsive accounts, with exponential backoff
+        """
+        now = time.time()
+        for account in self.accounts:
+            process = account.process
+            if process is None:
+                if now >= account.next_start:
+                    account.start()
+                continue
+
+            if process.is_alive() and now - account.heartbeat.value <= self.health_timeout:
+                continue
+
+            reason = 'died' if not process.is_alive() else 'stopped responding'
+            logger.warning(f'Account {account.name} {reason} (exitcode={process.exitcode}).')
+            account.stop(timeout=5)
+            account.restarts += 1
+            account.next_start = now + min(2 ** account.restarts, RESTART_BACKOFF_MAX)
+
+    def run(self) -> None:
+        self.check_health()
+        try:
+            while True:
+                start = time.time()
+                searched = self.searched
+                try:
+                    sent = self.search()
+                    logger.info(f'Shared search for {len(self.tags)} tags done: {sent}')
+                    self.pacer.success(self.searched - searched)
+                except Exception as e:
+                    logger.error(f'Shared search failed: {e}')
+                    self.pacer.failure()
+
+                until = time.time() + self.pacer.sleep_for(time.time() - start)
+                while time.time() < until:
+                    self.check_health()
+                    time.sleep(min(1.0, max(until - time.time(), 0)))
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self.searcher.shutdown()
+        self.watermarks.save()
+        for account in self.accounts:
+            account.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from twisper.loggers import setup_logging_pre
+
+    setup_logging_pre()
+    config_files = argv if argv is not None else sys.argv[1:]
+    try:
+        Supervisor(config_files).run()
+    except KeyboardInterrupt:
+        logger.info('SIGINT received, aborting ...')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
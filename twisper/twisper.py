@@ -2,17 +2,34 @@
 Freqtrade is the main module of this bot. It contains the class Freqtrade()
 """
 import copy
+import functools
 import logging
+import os
 import random
+import time
 import traceback
-from datetime import datetime, time, timedelta, timezone
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
 from math import isclose
 from threading import Lock
-from typing import Any, Dict, List, Optional, Tuple
-
-from twisper.config import Config
-from twisper.enums import State
-from twisper.twitter_api import T_API
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from twisper.config import Config, ConfigWatcher
+from twisper.audit import AuditLog
+from twisper.batch import TweetColumns, surviving_indices
+from twisper.enums import ActionType, EvictionPolicy, State, TimerType
+from twisper.eviction import Evictor
+from twisper.friends import FriendStore
+from twisper.matcher import KeywordMatcher
+from twisper.persistence import init_db
+from twisper.profiling import profiler
+from twisper.ranking import Ranker
+from twisper.records import TweetRecord
+from twisper.scheduler import Scheduler, buckets_from_config
+from twisper.search import SearchFanOut, Watermarks
+from twisper.seen import SeenIndex
+from twisper.twitter_api import API_CALLS, T_API
 
 
 logger = logging.getLogger(__name__)
@@ -24,11 +41,12 @@ class TwisperBot():
     This is from here the bot start its logic.
     """
 
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, api: Optional[T_API] = None) -> None:
         """
         Init all variables and objects the bot needs to work
         :param config: configuration dict, you can use Configuration.get_config()
         to get the config dict.
+        :param api: Twitter API to use, defaults to T_API (replays pass a fake one)
         """
         self.active_pair_whitelist: List[str] = []
 
@@ -39,7 +57,7 @@ class TwisperBot():
         self.config = config
 
         # Init api
-        self.api = T_API(self.config)
+        self.api = api if api is not None else T_API(self.config)
 
         self.dry_run = self.config.DRY_RUN
         if self.dry_run:
@@ -47,22 +65,131 @@ class TwisperBot():
         else:
             logger.warning('Bot is in LIVE mode, all actions are for realzies!')
 
+        self.matcher = KeywordMatcher(self.config)
+        self.ranker = Ranker.from_config(self.config)
+        self.audit = AuditLog(self.config.audit_file,
+                              batch_size=self.config.AUDIT_BATCH_SIZE,
+                              flush_interval=self.config.AUDIT_FLUSH_INTERVAL,
+                              fsync=self.config.AUDIT_FSYNC,
+                              max_bytes=self.config.AUDIT_MAX_BYTES,
+                              rotate_interval=self.config.AUDIT_ROTATE_INTERVAL,
+                              backup_count=self.config.AUDIT_BACKUP_COUNT,
+                              echo=self.config.AUDIT_ECHO)
+        self.watermarks = Watermarks(self.config.watermark_file)
+        self.searcher = SearchFanOut(self._search_tag, self.config.SEARCH_WORKERS)
+        self.seen = SeenIndex(self.config.seen_file, max_size=self.config.SEEN_MAX_SIZE,
+                              ttl=self.config.SEEN_MAX_AGE * 24 * 3600)
+        # Deferred tweet ids and their creation time (epoch seconds), oldest deferred first
+        self.deferred: 'OrderedDict[int, float]' = OrderedDict()
+        self._deferred_lock = Lock()
+        self.last_recheck = time.monotonic()
+        # Friendship status of the follow candidates looked up by prefetch_friendships
+        self.friendships: Dict[str, bool] = {}
+        # Queued follows, they count against FOLLOW_LIMIT and become friends once done
+        self.following: Set[str] = set()
+        self._follow_lock = Lock()
+
         self.banned_users = self.config.BANNED_USERS
         self.banned_name_keywords = self.config.BANNED_NAME_KEYWORDS
         self.last_rt = datetime.now(timezone.utc)
-        self.friend_count = 0
-        self.friends = self.get_friends()
+        os.makedirs(self.config.data_dir, exist_ok=True)
+        self.friends = FriendStore(self.config.friend_file)
+        self.get_friends()
+
 
+        self.ledger = init_db(self.config.db_file, self.dry_run)
 
-        # init_db(self.config['db_url'])
+        # Friends followed before the ledger existed go first
+        self.evictor = Evictor(EvictionPolicy(self.config.UNFOLLOW_POLICY))
+        follow_times = self.ledger.follow_times()
+        for name in self.friends:
+            self.evictor.add(name, follow_times.get(name, 0))
 
         # self.wallets = Wallets(self.config, self.exchange)
 
         # Set initial bot state from config
-        initial_state = self.config.get('initial_state')
+        initial_state = self.config.INITIAL_STATE
         self.state = State[initial_state.upper()] if initial_state else State.STOPPED
 
-        self._schedule = Scheduler()
+        self._schedule = Scheduler(buckets_from_config(self.config))
+
+        # Only wraps the hot methods when profiling is enabled
+        profiler.configure(self.config.PROFILING, self.config.CPROFILE_EVERY,
+                           self.config.CPROFILE_DIR)
+        profiler.instrument(self, ('search_tweets', 'validate_tweet', 'validate_tweets',
+                                   'original_tweet', 'is_banned_user', 'engage'))
+        profiler.instrument(self.api, API_CALLS, prefix='api.')
+
+        # Picks up config file changes between epochs
+        self.watcher: Optional[ConfigWatcher] = None
+        if self.config.CONFIG_RELOAD:
+            self.watcher = ConfigWatcher(self.config)
+            self.watcher.subscribe(self.apply_config)
+
+
+    def apply_config(self, config: Config) -> None:
+        '''
+        Switch to a reloaded config, derived structures are built before anything is swapped
+        '''
+        matcher = KeywordMatcher(config)
+        ranker = Ranker.from_config(config)
+        buckets = buckets_from_config(config)
+
+        self.config = config
+        self.api.config = config
+        self.matcher = matcher
+        self.ranker = ranker
+        self.banned_users = config.BANNED_USERS
+        self.banned_name_keywords = config.BANNED_NAME_KEYWORDS
+        self._schedule.set_buckets(buckets)
+
+
+    def cleanup(self) -> None:
+        '''
+        Cleanup pending resources on an already stopped bot
+        '''
+        logger.info('Cleaning up modules ...')
+        self._schedule.stop()
+        self.searcher.shutdown()
+        self.seen.save()
+        self.watermarks.save()
+        self.friends.save()
+        self.audit.close()
+        self.ledger.close()
+        self.api.close()
+
+
+    def process(self) -> Tuple[int, int]:
+        '''
+        Run one epoch: search, filter and engage one tweet after the other
+        Returns (tweets engaged, tweets searched)
+        '''
+        tweet_list = self.search_tweets()
+
+        tweets_engaged = 0
+        # Best giveaways first, their actions also get the rate limited budget first
+        ranked = self.ranker.rank(self.filter_tweets(tweet_list), self.matcher)
+        self.prefetch_friendships(ranked)
+        for tweet in ranked:
+            if self.engage(tweet):
+                tweets_engaged += 1
+
+        return tweets_engaged, len(tweet_list)
+
+
+    def handle_stream(self, data) -> bool:
+        '''
+        Run a streamed tweet (json or TweetRecord) through the same checks as searched ones and engage with it
+        '''
+        tweet = data if isinstance(data, TweetRecord) else self.api.parse_status(data)
+        tweets = self.filter_seen([tweet])
+        if not tweets:
+            return False
+
+        self.api.cache_tweets(tweets)
+        tweet = self.filter_tweet(tweets[0])
+
+        return tweet is not None and self.engage(tweet)
 
 
     def engage(self, tweet) -> bool:
@@ -77,36 +204,42 @@ class TwisperBot():
         '''
         rt_status = False
 
-        rt_tags = dm_tags = fl_tags = []
+        matched = self.matcher.match(tweet.text)
 
-        if any(x in tweet.text.lower() for x in self.config.TAGS_RT):
-            rt_tags = [i for i in self.config.TAGS_RT if i in tweet.text.lower().split()]
+        # Another giveaway from someone we follow
+        self.evictor.touch(tweet.user.screen_name, time.time(), self.giveaway_end(tweet))
+
+        if matched.rt:
             rt_status = self.retweet(tweet)
-        if any(x in tweet.text.lower() for x in self.config.TAGS_MSG):
-            dm_tags = [i for i in self.config.TAGS_MSG if i in tweet.text.lower().split()]
-            self.send_message(tweet.author_id)
-        if any(x in tweet.text.lower() for x in self.config.TAGS_FOLLOW):
-            fl_tags = [i for i in self.config.TAGS_FOLLOW if i in tweet.text.lower().split()]
+        if matched.msg:
+            self.send_message(tweet)
+        if matched.follow:
             self.follow(tweet)
 
         # Debug
-        self.log_tweet(tweet, rt_tags, dm_tags, fl_tags)
+        self.log_tweet(tweet, list(matched.rt), list(matched.msg), list(matched.follow))
 
         return rt_status
             
 
     def get_friends(self):
         '''
-        Get list of friends
+        Sync the cached friends with Twitter
         '''
-        self.friends = self.api.get_friends()
+        try:
+            self.friends.sync(self.api)
+        except Exception as e:
+            logger.error(f'Could not retrieve friends: {e}')
+            if self.config.wait_retrieve:
+                raise
 
 
     def is_banned_user(self, tweet):
         '''
         Check if the tweet author is banned
         '''
-        if tweet.user.screen_name.lower() in self.banned_users or any(x in tweet.user.name.lower() for x in self.banned_name_keywords):
+        name = tweet.user.name.lower()
+        if tweet.user.screen_name.lower() in self.banned_users or any(x in name for x in self.banned_name_keywords):
             # If it's the original one, we check if the author is banned
             logger.info("Avoided user with ID: " + tweet.user.screen_name + " & Name: " + tweet.user.name)
             return True
@@ -115,19 +248,28 @@ class TwisperBot():
 
     def get_original(self, tweet):
         '''
-        Possibly recursive function to get original tweet
+        Follow retweets down to the original tweet, served from the hydration cache when possible
         '''
-        pass
+        original = getattr(tweet, 'retweeted_status', None)
+        if original is None:
+            return tweet
+
+        original = self.api.get_statuses([original.id]).get(original.id, original)
+        return self.get_original(original)
 
 
     def original_tweet(self, tweet):
         '''
         Check if tweet is a retweet, if so, find original tweet
         '''
-        if tweet.retweeted_status is not None:
+        original = self.get_original(tweet)
+        if original is not tweet:
             # In case it is a retweet, we switch to the original one
-            if any(x in tweet.retweeted_status.text.lower().split() for x in self.config.TAGS_RT):
-                tweet = tweet.retweeted_status
+            if self.matcher.match(original.text).rt:
+                tweet = original
+                # Several retweets can point to the same original
+                if not self.seen.add(tweet.id):
+                    tweet = None
             else:
                 tweet = None
                 
@@ -138,43 +280,70 @@ class TwisperBot():
     DEBUG
     '''
     def log_tweet(self, tweet, rt_tags, dm_tags, fl_tags):
-        print('logging tweet')
-
-        file1 = open('myfile.txt', 'a')
-        seperator = '==========================================================================='
-        mini_sep = '======================'
-        date = tweet.created_at
-        user = tweet.username
-        screenname = tweet.screenname
-        tweet_text = tweet.text
-
-        string = f'''
-            {date}  --  username={user}  -//- screenname={screenname} \n 
-            {mini_sep} \n
-            RT_TAGS={rt_tags} \n
-            FL_TAGS={fl_tags} \n
-            DM_TAGS={dm_tags} \n
-            {mini_sep} \n
-            {tweet_text} \n
-            {seperator} \n\n
-        ''' 
-        
-        print(string)
-        # Writing multiple strings
-        # at a time
-        file1.writelines(string)
-        
-        # Closing file
-        file1.close()
+        '''
+        Queue an audit record for an engaged tweet, written in the background
+        '''
+        self.audit.write({
+            'id': tweet.id,
+            'date': tweet.created_at.isoformat(),
+            'username': tweet.user.screen_name,
+            'screenname': tweet.user.name,
+            'rt_tags': rt_tags,
+            'fl_tags': fl_tags,
+            'dm_tags': dm_tags,
+            'text': tweet.text,
+        })
+
+
+    def _priority(self, tweet):
+        '''
+        Scheduler priority of the actions for a tweet, and when they are not worth running anymore
+        '''
+        now = time.time()
+        priority = self.ranker.score(tweet, self.matcher.match(tweet.text))
+
+        return priority, min(self.giveaway_end(tweet), now + self.config.ACTION_MAX_WAIT)
+
+
+    def _submit(self, timer_type, action, func, *args, tweet_id=None, user_id=None,
+                screen_name=None, priority=0, deadline=None):
+        '''
+        Queue an API call on the scheduler, the ledger records it once it succeeded
+        '''
+        def record(future):
+            if not future.cancelled() and future.exception() is None and future.result():
+                self.ledger.record(action, tweet_id=tweet_id, user_id=user_id,
+                                   screen_name=screen_name)
+
+        try:
+            future = self._schedule.submit(timer_type, func, *args, priority=priority,
+                                           deadline=deadline)
+        except RuntimeError as e:
+            # Shutting down, the action is dropped like a cancelled one
+            logger.warning(f'{action.value} not queued: {e}')
+            future = Future()
+            future.cancel()
+            return future
+
+        future.add_done_callback(record)
+
+        return future
 
 
     def retweet(self, tweet):
         '''
         Retweet
         '''
-        status = self.api.retweet(tweet.id)
-        
-        return status
+        # Already retweeted, nothing failed
+        if self.ledger.has_tweet(ActionType.RETWEET, tweet.id):
+            return False
+
+        priority, deadline = self._priority(tweet)
+        self._submit(TimerType.RETWEET, ActionType.RETWEET, self.api.retweet, tweet.id,
+                     self.dry_run, tweet_id=tweet.id, user_id=tweet.user.id,
+                     priority=priority, deadline=deadline)
+
+        return True
 
 
     def like(self, tweet):
@@ -182,7 +351,13 @@ class TwisperBot():
         So we don't skip the tweet if we get the "You have already favorited this status." error
         If the tweets contains any like_tags, it automatically likes the tweet
         '''
-        self.api.like(tweet.id)
+        if self.ledger.has_tweet(ActionType.LIKE, tweet.id):
+            return
+
+        priority, deadline = self._priority(tweet)
+        self._submit(TimerType.LIKE, ActionType.LIKE, self.api.like, tweet.id, self.dry_run,
+                     tweet_id=tweet.id, user_id=tweet.user.id, priority=priority,
+                     deadline=deadline)
             
 
     def send_message(self, tweet):
@@ -190,67 +365,210 @@ class TwisperBot():
         Sends DM to tweet author
         '''
         # So we don't skip the tweet if we get the "You cannot send messages to users who are not following you." error
-        if self.config.ALLOW_CONTACT:
+        if self.config.ALLOW_CONTACT and not self.ledger.has_user(ActionType.MESSAGE, tweet.user.id):
             msg_text = self.config.MSG_TEXT[random.randint(0, len(self.config.MSG_TEXT) - 1)]
             # If the tweet contains any of the message_tags, we send a DM to the author with a random
             # sentence from the message_text list
-            self.api.send_message(text=msg_text, recipient_id=tweet.author_id)
+            priority, deadline = self._priority(tweet)
+            self._submit(TimerType.MESSAGE, ActionType.MESSAGE, self.api.send_message,
+                         tweet.user.id, tweet.user.screen_name, msg_text, self.dry_run,
+                         tweet_id=tweet.id, user_id=tweet.user.id, priority=priority,
+                         deadline=deadline)
 
 
     def follow(self, tweet):
         '''
         If the tweet contains any follow_tags, it automatically follows all the users mentioned in the tweet (if there's any) + the author
         '''
+        user_ids = dict(zip(tweet.mentions, tweet.mention_ids))
+        user_ids[tweet.user.screen_name] = tweet.user.id
+        candidates = self.follow_candidates(tweet)
+
+        # Prefetched for the whole epoch, the others are looked up now
+        friendships = {x: self.friendships[x] for x in candidates if x in self.friendships}
+        friendships.update(self.check_friendships([x for x in candidates
+                                                   if x not in friendships]))
+
+        giveaway_end = self.giveaway_end(tweet)
+        priority, deadline = self._priority(tweet)
+
         addFriends = []
-        
-        friends_count = len(self.friends)
-        
-        if tweet.username not in self.friends:
-            self.api.follow(tweet.username, self.dry_run)
-            
-            addFriends.append(tweet.username)
-            
-        for name in tweet.mentioned_user_ids:
-            if name.username in self.friends or name.username in addFriends:
+        for name, following in friendships.items():
+            if following:
+                # Missing from the local copy only
+                self.friends.add(name, user_ids.get(name))
+                self.evictor.add(name, time.time(), giveaway_end)
                 continue
 
-            self.api.follow(name.username, self.dry_run)
+            addFriends.append(name)
 
-            addFriends.append(name.username)
+        with self._follow_lock:
+            addFriends = [x for x in addFriends if x not in self.following]
+            self.following.update(addFriends)
 
         # Check if need to unfollow someone
         self.unfollow()
 
+        for name in addFriends:
+            future = self._submit(TimerType.FOLLOW, ActionType.FOLLOW, self.api.follow, name,
+                                  self.dry_run, screen_name=name, priority=priority,
+                                  deadline=deadline)
+            future.add_done_callback(functools.partial(self._followed, name, user_ids.get(name),
+                                                       giveaway_end))
+
 
-    def unfollow(self, friends_count, potential_friends) -> None:
+    def _followed(self, name, user_id, giveaway_end, future) -> None:
+        '''
+        Done callback of a queued follow, only a successful one adds a friend
+        '''
+        done = not future.cancelled() and future.exception() is None and future.result()
+        with self._follow_lock:
+            self.following.discard(name)
+            if done:
+                self.friends.add(name, user_id)
+                self.evictor.add(name, time.time(), giveaway_end)
+
+
+    def follow_candidates(self, tweet):
+        '''
+        Author and mentioned users of a tweet we don't follow yet
+        '''
+        candidates = [tweet.user.screen_name, *tweet.mentions]
+        return [x for x in dict.fromkeys(candidates)
+                if x not in self.friends and x not in self.following and
+                not self.ledger.is_following(x)]
+
+
+    def prefetch_friendships(self, tweets) -> None:
+        '''
+        Look up the follow candidates of a batch of tweets at once (100 users per request),
+        instead of one friendships/lookup request per tweet in follow()
+        '''
+        candidates = []
+        for tweet in tweets:
+            if self.matcher.match(tweet.text).follow:
+                candidates.extend(self.follow_candidates(tweet))
+
+        self.friendships = self.check_friendships(list(dict.fromkeys(candidates)))
+
+
+    def check_friendships(self, screen_names):
+        '''
+        Ask Twitter which of the users we already follow, skipped while friendships/lookup
+        has no calls left (15 per 15 min), a rate limited request would block.
+        Returns {screen_name: following}, users that couldn't be checked count as not followed
+        '''
+        status = {x: False for x in screen_names}
+        if not screen_names:
+            return status
+
+        if not self.api.has_quota('friendships/lookup'):
+            logger.debug(f'No friendships/lookup calls left, not checking {len(screen_names)} users')
+            return status
+
+        try:
+            following = self.api.lookup_friendships(screen_names)
+        except Exception as e:
+            logger.warning(f'Friendship lookup failed: {e}')
+            return status
+
+        for name in screen_names:
+            status[name] = following.get(name.lower(), False)
+
+        return status
+
+
+    def unfollow(self) -> None:
         '''
         Twitter sets a limit of not following more than 2k people in total (varies depending on followers)
-        So every time the bot follows a new user, its deletes another one randomly
-        '''        
-        if friends_count + len(potential_friends) >= self.config.FOLLOW_LIMIT:
+        So every time the bot follows new users, it unfollows the same amount, picked by the eviction policy.
+        Queued follows count as friends
+        '''
+        unfollows = []
+        with self._follow_lock:
+            excess = len(self.friends) + len(self.following) - self.config.FOLLOW_LIMIT
+            while excess > 0:
+                x = self.evictor.pop()
+                if x is None:
+                    break
+                # Already gone since it was tracked
+                if x not in self.friends:
+                    continue
+
+                self.friends.remove(x)
+                unfollows.append(x)
+                excess -= 1
+
+        if unfollows:
             logger.info('At follow cap, unfollowing some folks.')
-            while friends_count < self.friend_count:
-                x = self.friends[random.randint(0, len(self.friends) - 1)]
+        # Submitted outside the lock, the follow callbacks run on the scheduler thread
+        for x in unfollows:
+            self._submit(TimerType.UNFOLLOW, ActionType.UNFOLLOW, self.api.unfollow, x,
+                         self.dry_run, screen_name=x)
 
-                self.api.unfollow(x)
 
-                self.friends.remove(x)
-                logger.info(f'Unfollowed @{x}')
-            
-        self.friends.extend(potential_friends)
+    def giveaway_end(self, tweet) -> float:
+        '''
+        When a giveaway is considered over, tweets older than MAX_AGE are not taken into account anymore
+        '''
+        return tweet.created_at.timestamp() + self.config.MAX_AGE * 24 * 3600
+
+
+    def filter_tweet(self, tweet):
+        '''
+        Run all checks on a searched tweet.
+        Returns the tweet to engage with (the original one for retweets), None to skip it
+        '''
+        if not self.validate_tweet(tweet):
+            self.defer(tweet)
+            return None
+
+        return self.filter_valid(tweet)
+
+
+    def filter_valid(self, tweet):
+        '''
+        Checks left once a tweet is validated: switch to the original one and check its author
+        '''
+        tweet = self.original_tweet(tweet)
+        if tweet is None or self.is_banned_user(tweet):
+            return None
+
+        return tweet
+
+
+    def filter_tweets(self, tweets):
+        '''
+        filter_tweet for a whole batch, validated at once with validate_tweets
+        Returns the tweets to engage with, in the batch order
+        '''
+        valid = [tweets[i] for i in self.validate_tweets(tweets)]
+        self.hydrate(valid)
+        filtered = (self.filter_valid(x) for x in valid)
+        return [x for x in filtered if x is not None]
+
+
+    def hydrate(self, tweets) -> None:
+        '''
+        Look up the originals of the retweets in a batch at once, 100 per request and only
+        the ones missing from the cache, get_original then finds them all in the cache
+        '''
+        original_ids = [x.retweeted_status.id for x in tweets if x.retweeted_status is not None]
+        if not original_ids:
+            return
+
+        try:
+            self.api.get_statuses(original_ids)
+        except Exception as e:
+            logger.warning(f'Failed to look up {len(original_ids)} original tweets: {e}')
 
 
     def validate_tweet(self, tweet) -> bool: 
         '''
         Validates tweet.
         '''
-        valid_words = True
-
         # Check for banned words
-        for word in self.config.BANNED_KEYWORDS:
-            if (tweet.text.lower().find(word) != -1):
-                valid_words = False
-                break
+        valid_words = not self.matcher.match(tweet.text).banned
 
         # Check date is within config
         valid_date = valid_words and self.tweet_date_valid(tweet)
@@ -264,13 +582,91 @@ class TwisperBot():
         return rt_required
     
 
+    def validate_tweets(self, tweets) -> list:
+        '''
+        Batch validate_tweet: the age mask runs over the whole batch, the recent tweets are
+        split by retweet count and only the established ones are matched against the keywords.
+        Returns the indices of the valid tweets
+        '''
+        columns = TweetColumns(tweets)
+        recent = surviving_indices(columns.created_at, columns.retweet_count, time.time(),
+                                   self.config.MAX_AGE, 0)
+
+        keep = []
+        retweet_count, min_rt_count = columns.retweet_count, self.config.MIN_RT_COUNT
+        for i in recent:
+            if retweet_count[i] >= min_rt_count:
+                keep.append(i)
+            else:
+                # Recent enough but not established yet
+                self.defer(tweets[i])
+
+        matches = [self.matcher.match(tweets[i].text) for i in keep]
+        return [i for i, x in zip(keep, matches) if x.rt and not x.banned]
+
+
+    def defer(self, tweet) -> bool:
+        '''
+        A giveaway failing only the retweet count check is taken out of the seen index,
+        so it is picked up again once it has enough retweets.
+        Returns True if the tweet was deferred
+        '''
+        matched = self.matcher.match(tweet.text)
+        if tweet.retweet_count >= self.config.MIN_RT_COUNT or not matched.rt or \
+                matched.banned or not self.tweet_date_valid(tweet):
+            return False
+
+        self.seen.discard(tweet.id)
+        with self._deferred_lock:
+            self.deferred[tweet.id] = tweet.created_at.timestamp()
+            self.deferred.move_to_end(tweet.id)
+            while len(self.deferred) > self.config.RECHECK_SIZE:
+                self.deferred.popitem(last=False)
+        return True
+
+
+    def recheck(self, force=False) -> list:
+        '''
+        Look the deferred tweets up again once per RECHECK_INTERVAL, for up to date retweet counts.
+        Search only returns tweets newer than the watermarks, this is how they get another chance.
+        Returns the ones still recent enough, to go through filter_seen and the checks again
+        '''
+        now = time.monotonic()
+        if not force and now - self.last_recheck < self.config.RECHECK_INTERVAL:
+            return []
+        self.last_recheck = now
+
+        oldest = time.time() - (self.config.MAX_AGE + 1) * 24 * 3600
+        with self._deferred_lock:
+            for x in [x for x, created in self.deferred.items() if created <= oldest]:
+                del self.deferred[x]
+            tweet_ids = list(self.deferred)
+        if not tweet_ids:
+            return []
+
+        try:
+            tweets = self.api.get_statuses(tweet_ids, refresh=True)
+        except Exception as e:
+            # Kept for the next recheck
+            logger.error(f'Failed to look up {len(tweet_ids)} deferred tweets: {e}')
+            return []
+
+        # Tweets deferred during the lookup wait for the next recheck
+        with self._deferred_lock:
+            for x in tweet_ids:
+                self.deferred.pop(x, None)
+
+        # Deleted tweets are left out
+        return [tweets[x] for x in tweet_ids if x in tweets]
+
+
     def is_rt_required(self, tweet) -> bool:
         ''' 
         Check if tweet needs to be retweeted. 
         Only care about the ones that do.
         '''
 
-        return any(x in tweet.text.lower().split() for x in self.config.TAGS_RT)
+        return bool(self.matcher.match(tweet.text).rt)
         
 
     def search_tweets(self):
@@ -279,13 +675,55 @@ class TwisperBot():
         '''
         searched_tweets = []
 
-        for tag in self.config.TAGS_SEARCH:
-            searched_tweets += self.api.search_tweets(q=tag, lang='en', include_rts=False,  count=self.config.MAX_RESULTS)
+        for result in self.iter_search():
+            searched_tweets.extend(self.filter_seen(result.tweets))
+        searched_tweets.extend(self.filter_seen(self.recheck()))
 
-        self.api.search_geo
+        self.end_epoch()
         return searched_tweets
 
 
+    def filter_seen(self, tweets):
+        '''
+        Skip tweets found by several tags or handled in a previous epoch
+        '''
+        return [x for x in tweets if self.seen.add(x.id)]
+
+
+    def end_epoch(self) -> None:
+        '''
+        Persist search state once all tags of an epoch were searched, then apply config changes
+        '''
+        self.seen.save()
+        self.watermarks.save()
+        self.friends.save()
+        self.ledger.flush()
+        if self.watcher is not None:
+            self.watcher.poll()
+
+
+    def iter_search(self):
+        '''
+        Search all tags concurrently, yields a SearchResult per tag as soon as it arrives
+        '''
+        return self.searcher.search(self.config.TAGS_SEARCH)
+
+
+    def _search_tag(self, tag):
+        '''
+        Search a single tag
+        '''
+        tweets, next_max_id = self.api.search_tweets(query=tag, results=self.config.MAX_RESULTS,
+                                                     language='en',
+                                                     since_id=self.watermarks.get(tag),
+                                                     max_id=self.watermarks.resume(tag),
+                                                     max_pages=self.config.SEARCH_MAX_PAGES)
+        self.watermarks.update(tag, tweets, next_max_id)
+        self.api.cache_tweets(tweets)
+
+        return tweets
+
+
     def tweet_established(self, tweet) -> bool:
         '''
         Checks if tweet already has more than configured retweets
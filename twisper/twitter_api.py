@@ -1,16 +1,29 @@
-import tweepy
-from time import sleep
-from typing import Any
-
 import logging
+import time
 
-from twisper.enums import TimerType
+from twisper.cache import TTLCache
 from twisper.config import Config
+from twisper.enums import ErrorKind
+from twisper.quota import QuotaTracker
+from twisper.records import TweetRecord, UserRecord, loads, records_from_json
 
 logger = logging.getLogger(__name__)
 
+# Max ids per users/lookup, friendships/lookup and statuses/lookup request
+LOOKUP_BATCH_SIZE = 100
+
+# Methods hitting the API, timed per call when profiling is enabled
+API_CALLS = ('get_friends', 'get_friend_ids', 'lookup_users', 'get_statuses',
+             'lookup_friendships', 'retweet', 'like', 'send_message', 'follow', 'unfollow',
+             'search_tweets')
+
 class T_API:
     def __init__(self, config: Config) -> None:
+        # tweepy and the HTTP stack are the bulk of the startup time, only load them when needed
+        import tweepy
+
+        from twisper.session import create_session
+
         self.auth =tweepy.OAuth1UserHandler(config.API_KEY,
                                     config.API_KEY_SECRET,
                                     config.ACCESS_TOKEN,
@@ -18,19 +31,135 @@ class T_API:
 
         self.twitter = tweepy.API(self.auth)
         self.config = config
+
+        # One pooled keep-alive session for all search and action threads
+        self.session = create_session(pool_size=config.HTTP_POOL_SIZE,
+                                      retries=config.HTTP_RETRIES,
+                                      backoff_factor=config.HTTP_BACKOFF,
+                                      max_retry_wait=config.HTTP_MAX_RETRY_WAIT,
+                                      timeouts=config.HTTP_TIMEOUTS,
+                                      default_timeout=config.HTTP_DEFAULT_TIMEOUT)
+        self.twitter.session = self.session
+
+        # Rate limit headers and error kinds per endpoint
+        self.quota = QuotaTracker()
+        self.session.hooks['response'].append(self.quota.hook)
+
+        # Hydrated tweets, authors come embedded in them
+        self.statuses = TTLCache(config.CACHE_SIZE, config.CACHE_TTL)
         
 
+    def close(self) -> None:
+        '''
+        Close the pooled connections
+        '''
+        self.session.shutdown()
+
+
+    def has_quota(self, endpoint) -> bool:
+        '''
+        False while the last response of endpoint (e.g. "friendships/lookup") left no calls
+        before its rate limit reset
+        '''
+        quota = self.quota.get(endpoint)
+        return quota is None or quota[1] > 0 or quota[2] <= time.time()
+
+
     def get_friends(self) -> list:
         '''
-        Get list of friends
+        Get list of friends, following the cursor through all pages
         '''
+        import tweepy
+
         logger.info('Retreiving friends.')
-        friend_list = self.twitter.get_friends()
+        friend_list = tweepy.Cursor(self.twitter.get_friends, count=200).items()
         friends = [x.screen_name for x in friend_list]
 
-        return friends        
+        return friends
+
+
+    def get_friend_ids(self) -> list:
+        '''
+        Get ids of all friends, 5000 per request
+        '''
+        import tweepy
+
+        return list(tweepy.Cursor(self.twitter.get_friend_ids, count=5000).items())
+
+
+    def lookup_users(self, user_ids) -> list:
+        '''
+        Look up users by id, 100 per request
+        '''
+        from tweepy.parsers import RawParser
+
+        user_ids = list(user_ids)
+        users = []
+        for i in range(0, len(user_ids), LOOKUP_BATCH_SIZE):
+            payload = self.twitter.lookup_users(user_id=user_ids[i:i + LOOKUP_BATCH_SIZE],
+                                                parser=RawParser())
+            users += [UserRecord.from_json(x) for x in loads(payload)]
+
+        return users
     
     
+    def parse_status(self, data) -> TweetRecord:
+        '''
+        Build a record from decoded tweet json (e.g. received from the stream)
+        '''
+        return TweetRecord.from_json(data)
+
+
+    def cache_tweets(self, tweets) -> None:
+        '''
+        Store searched tweets and their retweeted originals in the cache
+        '''
+        for tweet in tweets:
+            self.statuses.set(tweet.id, tweet)
+
+            original = getattr(tweet, 'retweeted_status', None)
+            if original is not None:
+                self.statuses.set(original.id, original)
+
+
+    def get_statuses(self, tweet_ids, refresh=False) -> dict:
+        '''
+        Tweets by id, only the ones missing from the cache are looked up (100 per request)
+        refresh looks all of them up again, e.g. for up to date retweet counts
+        '''
+        from tweepy.parsers import RawParser
+
+        if refresh:
+            statuses, missing = {}, list(tweet_ids)
+        else:
+            statuses, missing = self.statuses.get_many(tweet_ids)
+        for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            payload = self.twitter.lookup_statuses(missing[i:i + LOOKUP_BATCH_SIZE],
+                                                   parser=RawParser())
+            for status in records_from_json(payload):
+                self.statuses.set(status.id, status)
+                statuses[status.id] = status
+
+        return statuses
+
+
+    def lookup_friendships(self, screen_names) -> dict:
+        '''
+        Relationship of the bot with each user, 100 users per request
+        Returns {screen_name (lowercase): True if already following or requested}
+        '''
+        screen_names = list(screen_names)
+        following = {}
+        for i in range(0, len(screen_names), LOOKUP_BATCH_SIZE):
+            relations = self.twitter.lookup_friendships(
+                screen_name=screen_names[i:i + LOOKUP_BATCH_SIZE])
+            for relation in relations:
+                following[relation.screen_name.lower()] = \
+                    relation.is_following or relation.is_following_requested
+
+        return following
+
+
     def retweet(self, id, dry_run) -> bool:
         '''
         Retweet
@@ -40,17 +169,11 @@ class T_API:
             if dry_run:
                 print(f'Retweeted {id}')
             else:
-                status = self.twitter.retweet(id)
+                self.twitter.retweet(id)
             logger.info(f'Retweeted {id}')
-
-            self._sleep(TimerType.RETWEET)
         except Exception as e:
-            status = False
-            # In case the error contains sentences that mean the app is probably banned or the user over daily
-            # status update limit, we cancel the function
-            print(str(e))
-            if "retweeted" not in str(e):
-                logger.error(str(e))
+            # Already retweeted counts as done, anything else is counted by kind
+            status = self._failed('statuses/retweet/:id', e)
 
         return status
 
@@ -64,14 +187,13 @@ class T_API:
 
         try:
             if dry_run:
-                print("Liked: " + id)
+                print(f'Liked: {id}')
             else:
                 self.twitter.create_favorite(id)
 
-            logger.info("Liked: " + str(id))
-        except:
-            status = False
-            pass
+            logger.info(f'Liked: {id}')
+        except Exception as e:
+            status = self._failed('favorites/create', e)
 
         return status
 
@@ -87,11 +209,8 @@ class T_API:
             try:
                 self.twitter.send_direct_message(text=msg_text,recipient_id=author_id)
                 logger.info(f'Sent DM to {username}')
-                
-                self._sleep(TimerType.MESSAGE)
-            except:
-                status = False
-                pass
+            except Exception as e:
+                status = self._failed('direct_messages/events/new', e)
         
         return status
 
@@ -103,57 +222,64 @@ class T_API:
         status = True
 
         if dry_run:
-            print(f'Sent DM to {username}')
-            logger.info(f'Sent DM to {username}')
+            print(f'Followed @{username}')
+            logger.info(f'Followed @{username}')
         else:
             try:
-                self.twitter.create_friendship(username)
-                logger.info(f'Sent DM to {username}')
-
-                sleep(TimerType.FOLLOW)
-            except:
-                pass
+                self.twitter.create_friendship(screen_name=username)
+                logger.info(f'Followed @{username}')
+            except Exception as e:
+                status = self._failed('friendships/create', e)
     
         return status
 
 
-    def unfollow(self, screen_name) -> bool:
+    def unfollow(self, screen_name, dry_run) -> bool:
         '''
         Unfollow friend
         ''' 
         status = False
         try:
-            self.twitter.destroy_friendship(screen_name)
+            if dry_run:
+                print(f'Unfollowed @{screen_name}')
+            else:
+                self.twitter.destroy_friendship(screen_name=screen_name)
             logger.info(f'Unfollowed @{screen_name}')
 
             status = True
         except Exception as e:
-            print(e)
+            status = self._failed('friendships/destroy', e)
         
         return status
 
 
-    def _sleep(self, timer_type):
+    def _failed(self, endpoint, error) -> bool:
         '''
-        Sleep func based on who called it
+        Count a failed action by kind
+        Returns True if the action was already done before, so callers can treat it as done
         '''
-        sleep_timer = 0
-
-        if timer_type == TimerType.RETWEET:
-            sleep_timer = self.config.TIMER_RT
-        elif timer_type == TimerType.FOLLOW:
-            sleep_timer = self.config.TIMER_FOLLOW
-        elif timer_type == TimerType.MESSAGE:
-            sleep_timer = self.config.TIMER_MSG
-        else:
-            logger.error('Wrong timer type received')
-            sleep_timer = self.config.TIMER_SLEEP
+        return self.quota.record_error(endpoint, error) == ErrorKind.ALREADY_DONE
 
-        sleep(sleep_timer)
 
-
-    def search_tweets(self, query, results, language) -> Any:
+    def search_tweets(self, query, results, language, since_id=None, max_id=None,
+                      max_pages=1) -> tuple:
         '''
-        Search for tweets
+        Search for tweets newer than since_id (and not above max_id), paging back for up to max_pages pages.
+        The response is decoded straight into TweetRecords, no tweepy models are built.
+        Returns (tweets, max_id to resume paging from), the latter None once paging reached since_id
         '''
-        return self.twitter.search_tweets(q=query, lang=language, include_rts=False,  count=results)
\ No newline at end of file
+        from tweepy.parsers import RawParser
+
+        tweets = []
+        for _ in range(max_pages):
+            payload = self.twitter.search_tweets(q=query, lang=language, include_rts=False,
+                                                 count=results, since_id=since_id, max_id=max_id,
+                                                 parser=RawParser())
+            data = loads(payload)
+            page = records_from_json(data)
+            tweets.extend(page)
+            if not page or 'next_results' not in data.get('search_metadata', {}):
+                return tweets, None
+            max_id = min(x.id for x in page) - 1
+
+        return tweets, max_id
@@ -2,13 +2,20 @@ import logging
 import time
 from os import getpid
 
-from typing import Any, Optional, Callable
+from typing import TYPE_CHECKING, Any, Optional, Callable
 
 from twisper import __version__
 from twisper.config import Config
 from twisper.enums import RunMode, State
+from twisper.metrics import registry
+from twisper.pipeline import EngagePipeline
+from twisper.profiling import profiler
+from twisper.scheduler import pacer_from_config
 from twisper.twisper import TwisperBot
 
+if TYPE_CHECKING:
+    from twisper.stream import TweetStream
+
 # get logger
 logger = logging.getLogger(__name__)
 
@@ -22,8 +29,28 @@ class Worker:
         self._config = config
         self._heartbeat_msg: float = 0
         self._heartbeat_interval = self._config.HEARTBEAT_INTERVAL
+        self._last_save = time.monotonic()
 
         self.twisper = TwisperBot(self._config)
+        self.pacer = pacer_from_config(self._config)
+
+        if self._config.METRICS_PORT:
+            registry.serve(self._config.METRICS_PORT)
+
+        self.stream: Optional['TweetStream'] = None
+        self.pipeline: Optional[EngagePipeline] = None
+        if self._config.RUN_MODE == RunMode.STREAM:
+            from twisper.stream import TweetStream
+
+            self.stream = TweetStream(self._config, self.twisper.handle_stream,
+                                      queue_size=self._config.PIPELINE_QUEUE_SIZE)
+        elif self._config.PIPELINE:
+            self.pipeline = EngagePipeline(self.twisper,
+                                           queue_size=self._config.PIPELINE_QUEUE_SIZE,
+                                           pacer=self.pacer)
+
+        if self.twisper.watcher is not None:
+            self.twisper.watcher.subscribe(self._apply_config)
 
 
     def run(self) -> None:
@@ -33,7 +60,17 @@ class Worker:
 
 
     def start_up(self) -> None:
-        pass
+        if self.stream:
+            self.stream.start()
+        if self.pipeline:
+            self.pipeline.start()
+
+
+    def shut_down(self) -> None:
+        if self.stream:
+            self.stream.stop()
+        if self.pipeline:
+            self.pipeline.stop(timeout=self._config.TIMER_SLEEP + 60)
 
 
     def _worker(self, old_state: Optional[State]) -> State:
@@ -50,8 +87,8 @@ class Worker:
                 f"Changing state{f' from {old_state.name}' if old_state else ''} to: {state.name}")
 
             if state == State.STOPPED:
-                # TODO: check if there is anything mid process
-                pass
+                # Let tweets already in the pipeline finish
+                self.shut_down()
 
             if state == State.RUNNING:
                 self.start_up()
@@ -61,9 +98,23 @@ class Worker:
             self._heartbeat_msg = 0
 
 
-        elif self.state == State.RUNNING:
-            # Use an offset of 1s to ensure a new candle has been issued
-            self._throttle(throttle_secs=self._config.TIMER_SLEEP)
+        elif state == State.RUNNING and not (self.pipeline or self.stream):
+            self._throttle(self._process)
+
+        else:
+            # The pipeline or the stream drive the bot, we only keep the state machine ticking
+            self._sleep(self._config.TIMER_SLEEP)
+            if self.stream and state == State.RUNNING:
+                # Deferred giveaways are not streamed again
+                # Handled on the stream's handler thread, like streamed ones
+                for tweet in self.twisper.recheck():
+                    self.stream.put(tweet)
+            if self.stream and time.monotonic() - self._last_save >= self._config.STREAM_SAVE_INTERVAL:
+                # Streamed tweets have no epochs, persist their state and check for config changes here
+                self._last_save = time.monotonic()
+                self.twisper.end_epoch()
+            elif self.stream and self.twisper.watcher is not None:
+                self.twisper.watcher.poll()
 
         if self._heartbeat_interval:
             now = time.time()
@@ -71,27 +122,58 @@ class Worker:
                 version = __version__
                 logger.info(f"Bot heartbeat. PID={getpid()}, "
                             f"version='{version}', state='{state.name}'")
+                quota = getattr(self.twisper.api, 'quota', None)
+                if quota:
+                    logger.info(quota.summary())
+                if profiler.enabled:
+                    logger.info(profiler.summary())
                 self._heartbeat_msg = now
 
         return state
 
 
-    def _throttle(self, throttle_secs: float):
+    def _apply_config(self, config: Config) -> None:
+        """
+        Follow a reloaded config: timers and tracked tags
+        """
+        self._config = config
+        self._heartbeat_interval = config.HEARTBEAT_INTERVAL
+        self.pacer.update(pacer_from_config(config))
+        if self.stream:
+            self.stream.update_config(config)
+
+
+    def _process(self) -> int:
+        """
+        Run one epoch
+        :return: number of new tweets searched
+        """
+        tweets_engaged, tweets_searched = self.twisper.process()
+        logger.info(f'Engaged with {tweets_engaged}/{tweets_searched} tweets.')
+        return tweets_searched
+
+
+    def _throttle(self, func: Callable[[], int]) -> None:
         """
-        Throttles the given callable that it
-        takes at least `min_secs` to finish execution.
-        :param throttle_secs: throttling interation execution time limit in seconds
-        :return: Any (result of execution of func)
+        Runs func, then sleeps for what is left of the epoch interval. The interval
+        adapts to the number of new tweets func returns, errors back off.
+        :param func: epoch callable, returns the number of new tweets
         """
         last_throttle_start_time = time.time()
         logger.debug("========================================")
+        try:
+            with profiler.epoch():
+                self.pacer.success(func())
+        except Exception as e:
+            logger.error(f'Epoch failed: {e}')
+            self.pacer.failure()
         time_passed = time.time() - last_throttle_start_time
-        sleep_duration = throttle_secs - time_passed
-        sleep_duration = max(sleep_duration, 0.0)
+        sleep_duration = self.pacer.sleep_for(time_passed)
 
         logger.debug(f"Sleeping for {sleep_duration:.2f} s, "
                      f"last iteration took {time_passed:.2f} s.")
-        self._sleep(sleep_duration)
+        with profiler.stage('sleep'):
+            self._sleep(sleep_duration)
 
 
     @staticmethod
@@ -100,7 +182,11 @@ class Worker:
         time.sleep(sleep_duration)
 
     def exit(self) -> None:
-        pass
+        self.shut_down()
+        if self.twisper:
+            self.twisper._schedule.drain(timeout=self._config.TIMER_SLEEP)
+            self.twisper.cleanup()
+        registry.shutdown()
 
 
 